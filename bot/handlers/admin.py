@@ -1,29 +1,30 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, BufferedInputFile
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 import asyncio
-import uuid
 import datetime
 from bot.keyboards.inline import (
     create_back_keyboard, create_broadcast_confirmation_keyboard, create_premium_status_keyboard,
     create_admin_panel_keyboard, create_admin_status_keyboard
 )
 from bot.utils.database import (
-    get_user, update_user_limit, get_all_users, get_user_stats, get_top_users,
-    set_premium_status, save_promo_code, set_admin_status, check_is_admin
+    get_user_snapshot, update_user_limit, count_users, iter_user_ids, get_user_stats, get_top_users,
+    set_premium_status, save_promo_codes_bulk, generate_promo_code,
+    set_admin_status, check_is_admin
 )
 from bot.utils.logger import get_logger
 from bot.utils.crypto_pay import CryptoPayAPI
 from config.config import load_config
-from cachetools import TTLCache
+from bot.utils.user_cache import user_cache
 
 logger = get_logger(__name__)
 router = Router()
 config = load_config()
-user_cache = TTLCache(maxsize=1000, ttl=300)
+PROMO_CODES_INLINE_LIMIT = 100
+PROMO_CODES_MAX_COUNT = 100000
 
 class AdminStates(StatesGroup):
     waiting_for_user_id = State()
@@ -103,10 +104,7 @@ async def process_admin_user_id(message: Message, state: FSMContext):
             await state.clear()
             return
         target_user_id = int(message.text.strip())
-        user = user_cache.get(target_user_id)
-        if not user:
-            user = await get_user(target_user_id)
-            user_cache[target_user_id] = user
+        user = await user_cache.get_or_load(target_user_id, get_user_snapshot)
         if user:
             await state.update_data(target_user_id=target_user_id)
             await message.answer(f"{user['full_name']} (ID: {target_user_id}) foydalanuvchisi uchun yangi test limitini kiriting:")
@@ -147,7 +145,6 @@ async def process_admin_new_limit(message: Message, state: FSMContext):
             f"✅ {target_user_id} ID raqamli foydalanuvchi uchun test limiti {new_limit} ga o'zgartirildi.",
             reply_markup=create_admin_panel_keyboard()
         )
-        user_cache.pop(target_user_id, None)
         await state.clear()
     except ValueError:
         await message.answer(
@@ -206,9 +203,9 @@ async def process_admin_broadcast_message(message: Message, state: FSMContext):
             broadcast_data["media"] = message.document.file_id
             broadcast_data["media_type"] = "document"
         await state.update_data(broadcast_data=broadcast_data)
-        users = await get_all_users()
+        total_users = await count_users()
         preview_text = broadcast_data["text"][:200] + "..." if len(broadcast_data["text"]) > 200 else broadcast_data["text"]
-        preview_message = f"Siz ushbu xabarni {len(users)} ta foydalanuvchiga yubormoqchisiz:\n\n{preview_text}"
+        preview_message = f"Siz ushbu xabarni {total_users} ta foydalanuvchiga yubormoqchisiz:\n\n{preview_text}"
         if broadcast_data["media"]:
             preview_message += f"\n\n(Media bilan birga: {broadcast_data['media_type']})"
         await message.answer(
@@ -235,45 +232,45 @@ async def process_confirm_broadcast(callback_query: CallbackQuery, state: FSMCon
             await callback_query.answer("Xatolik: Xabar ma'lumotlari topilmadi", show_alert=True)
             return
         await callback_query.message.edit_text("📤 Xabar yuborilmoqda...")
-        users = await get_all_users()
-        total_users = len(users)
+        total_users = 0
         sent_count = 0
         blocked_count = 0
         failed_count = 0
-        for user in users:
+        async for recipient_id in iter_user_ids():
+            total_users += 1
             try:
                 if broadcast_data["media"]:
                     if broadcast_data["media_type"] == "photo":
                         await callback_query.bot.send_photo(
-                            user["id"],
+                            recipient_id,
                             broadcast_data["media"],
                             caption=broadcast_data["text"],
                             parse_mode="HTML"
                         )
                     elif broadcast_data["media_type"] == "video":
                         await callback_query.bot.send_video(
-                            user["id"],
+                            recipient_id,
                             broadcast_data["media"],
                             caption=broadcast_data["text"],
                             parse_mode="HTML"
                         )
                     elif broadcast_data["media_type"] == "animation":
                         await callback_query.bot.send_animation(
-                            user["id"],
+                            recipient_id,
                             broadcast_data["media"],
                             caption=broadcast_data["text"],
                             parse_mode="HTML"
                         )
                     elif broadcast_data["media_type"] == "document":
                         await callback_query.bot.send_document(
-                            user["id"],
+                            recipient_id,
                             broadcast_data["media"],
                             caption=broadcast_data["text"],
                             parse_mode="HTML"
                         )
                 else:
                     await callback_query.bot.send_message(
-                        user["id"],
+                        recipient_id,
                         broadcast_data["text"],
                         parse_mode="HTML"
                     )
@@ -281,7 +278,7 @@ async def process_confirm_broadcast(callback_query: CallbackQuery, state: FSMCon
             except TelegramForbiddenError:
                 blocked_count += 1
             except Exception as e:
-                logger.error(f"Error sending broadcast to user {user['id']}: {e}", exc_info=True)
+                logger.error(f"Error sending broadcast to user {recipient_id}: {e}", exc_info=True)
                 failed_count += 1
         status_message = (
             f"📊 Xabar yuborish yakunlandi:\n\n"
@@ -329,10 +326,7 @@ async def process_premium_user_id(message: Message, state: FSMContext):
             await state.clear()
             return
         target_user_id = int(message.text.strip())
-        user = user_cache.get(target_user_id)
-        if not user:
-            user = await get_user(target_user_id)
-            user_cache[target_user_id] = user
+        user = await user_cache.get_or_load(target_user_id, get_user_snapshot)
         if user:
             await state.update_data(target_user_id=target_user_id)
             await message.answer(
@@ -372,7 +366,6 @@ async def process_set_premium_status(callback_query: CallbackQuery, state: FSMCo
             f"✅ {target_user_id} ID raqamli foydalanuvchi uchun premium statusi {status_text}.",
             reply_markup=create_admin_panel_keyboard()
         )
-        user_cache.pop(target_user_id, None)
         await state.clear()
     except Exception as e:
         logger.error(f"Error in set_premium_status for user {user_id}: {e}", exc_info=True)
@@ -394,7 +387,13 @@ async def process_admin_stats(callback_query: CallbackQuery):
             f"👥 Jami foydalanuvchilar: {stats['total_users']}\n"
             f"💎 Premium foydalanuvchilar: {stats['premium_users']}\n"
             f"📝 Yaratilgan testlar: {stats['total_tests']}\n"
-            f"⭐️ Taqsimlangan yulduzlar: {stats['total_stars']}"
+            f"⭐️ Taqsimlangan yulduzlar: {stats['total_stars']}\n\n"
+            f"📅 Bugun: +{stats['new_users_today']} foydalanuvchi, +{stats['tests_today']} test\n"
+            f"📈 Oxirgi {stats['trend_days']} kun:\n"
+            f"• Yangi foydalanuvchilar: {stats['new_users_period']}\n"
+            f"• Premium faollashtirildi: {stats['premium_activations_period']}\n"
+            f"• Yaratilgan testlar: {stats['tests_period']}\n"
+            f"• Berilgan yulduzlar: {stats['stars_earned_period']}"
         )
         await callback_query.message.edit_text(
             text,
@@ -464,18 +463,30 @@ async def process_promo_count(message: Message, state: FSMContext):
         if count <= 0:
             await message.answer("Iltimos, musbat son kiriting.")
             return
+        if count > PROMO_CODES_MAX_COUNT:
+            await message.answer(f"Bir martada ko'pi bilan {PROMO_CODES_MAX_COUNT} ta promo kod yaratish mumkin.")
+            return
         data = await state.get_data()
         duration = data.get("promo_duration")
-        promo_codes = []
-        for _ in range(count):
-            code = str(uuid.uuid4())[:8].upper()
-            await save_promo_code(code, duration)
-            promo_codes.append(code)
-        codes_text = "\n".join([f"• {code}" for code in promo_codes])
-        await message.answer(
-            f"✅ {count} ta promo kod yaratildi (amal qilish muddati: {duration} kun):\n\n{codes_text}",
-            reply_markup=create_admin_panel_keyboard()
-        )
+        promo_codes = await save_promo_codes_bulk(
+            [generate_promo_code() for _ in range(count)], duration
+        )
+        header = f"✅ {len(promo_codes)} ta promo kod yaratildi (amal qilish muddati: {duration} kun)"
+        if len(promo_codes) > PROMO_CODES_INLINE_LIMIT:
+            await message.answer_document(
+                document=BufferedInputFile(
+                    "\n".join(promo_codes).encode("utf-8"),
+                    filename=f"promo_codes_{duration}d_{len(promo_codes)}.txt"
+                ),
+                caption=header,
+                reply_markup=create_admin_panel_keyboard()
+            )
+        else:
+            codes_text = "\n".join([f"• {code}" for code in promo_codes])
+            await message.answer(
+                f"{header}:\n\n{codes_text}",
+                reply_markup=create_admin_panel_keyboard()
+            )
         await state.clear()
     except ValueError:
         await message.answer(
@@ -516,10 +527,7 @@ async def process_admin_user_id(message: Message, state: FSMContext):
             await state.clear()
             return
         target_user_id = int(message.text.strip())
-        user = user_cache.get(target_user_id)
-        if not user:
-            user = await get_user(target_user_id)
-            user_cache[target_user_id] = user
+        user = await user_cache.get_or_load(target_user_id, get_user_snapshot)
         if user:
             await state.update_data(target_user_id=target_user_id)
             await message.answer(
@@ -559,7 +567,6 @@ async def process_set_admin_status(callback_query: CallbackQuery, state: FSMCont
             f"✅ {target_user_id} ID raqamli foydalanuvchi uchun admin statusi {status_text}.",
             reply_markup=create_admin_panel_keyboard()
         )
-        user_cache.pop(target_user_id, None)
         await state.clear()
     except Exception as e:
         logger.error(f"Error in set_admin_status for user {user_id}: {e}", exc_info=True)
@@ -0,0 +1,22 @@
+from aiogram import Router
+from aiogram.types import ChatMemberUpdated
+from bot.utils.subscription import record_membership_update, status_name
+from bot.utils.logger import get_logger
+from config.config import load_config
+
+logger = get_logger(__name__)
+router = Router()
+config = load_config()
+REQUIRED_CHANNEL_IDS = {channel["id"] for channel in config.required_channels}
+
+# Only sent for channels where the bot is admin and chat_member is in allowed_updates.
+@router.chat_member()
+async def process_chat_member_update(event: ChatMemberUpdated):
+    if event.chat.id not in REQUIRED_CHANNEL_IDS:
+        return
+    user_id = event.new_chat_member.user.id
+    status = status_name(event.new_chat_member.status)
+    try:
+        await record_membership_update(event.chat.id, user_id, status)
+    except Exception as e:
+        logger.error(f"Error recording membership update for user {user_id} in {event.chat.id}: {e}", exc_info=True)
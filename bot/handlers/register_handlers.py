@@ -1,6 +1,7 @@
 from aiogram import Dispatcher
 from bot.handlers.user import router as user_router
 from bot.handlers.admin import router as admin_router
+from bot.handlers.membership import router as membership_router
 from bot.middlewares.error_handler import ErrorHandlerMiddleware
 from bot.middlewares.subscription import SubscriptionMiddleware
 from bot.middlewares.throttling import ThrottlingMiddleware
@@ -14,3 +15,4 @@ def register_handlers(dp: Dispatcher):
     dp.callback_query.middleware(ThrottlingMiddleware())
     dp.include_router(user_router)
     dp.include_router(admin_router)
+    dp.include_router(membership_router)
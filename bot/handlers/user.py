@@ -1,16 +1,12 @@
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, PreCheckoutQuery, SuccessfulPayment, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.enums import ChatAction
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import BufferedInputFile
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 import asyncio
 import math
 import uuid
-import os
-import tempfile
 import datetime
 from bot.keyboards.inline import (
     create_main_keyboard, create_subscription_keyboard, create_skip_keyboard, create_back_keyboard,
@@ -19,22 +15,22 @@ from bot.keyboards.inline import (
     create_contact_admin_keyboard
 )
 from bot.utils.database import (
-    register_user, get_user, update_test_count, save_test_info, get_user_tests,
+    register_user, get_user_snapshot, get_user_tests_page,
     get_user_stars, add_user_stars, spend_stars_for_premium, set_premium_status,
     record_payment, update_payment_status, use_promo_code
 )
-from bot.utils.document import generate_test_document
+from bot.utils.generation_jobs import generation_workers
 from bot.utils.subscription import check_subscription
 from bot.utils.logger import get_logger
 from bot.utils.crypto_pay import CryptoPayAPI
 from config.config import load_config
-from cachetools import TTLCache
+from bot.utils.user_cache import user_cache
 
 logger = get_logger(__name__)
 router = Router()
 config = load_config()
 PAYMENT_PROVIDER_TOKEN = config.payment_token
-user_cache = TTLCache(maxsize=1000, ttl=300)
+TESTS_PAGE_SIZE = 10
 
 class TestGeneration(StatesGroup):
     waiting_for_subject = State()
@@ -89,7 +85,9 @@ async def cmd_help(message: Message):
 async def process_check_subscription(callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
     try:
-        is_subscribed = await check_subscription(user_id, config.required_channels)
+        is_subscribed = await check_subscription(
+            user_id, config.required_channels, bot=callback_query.bot, force_refresh=True
+        )
         if is_subscribed:
             await callback_query.message.edit_text(
                 "✅ Obuna bo'lganingiz uchun rahmat!\n\nEndi botning barcha imkoniyatlaridan foydalanishingiz mumkin.",
@@ -130,7 +128,7 @@ async def process_back_to_main(callback_query: CallbackQuery):
 async def process_generate_test(callback_query: CallbackQuery, state: FSMContext):
     user_id = callback_query.from_user.id
     try:
-        is_subscribed = await check_subscription(user_id, config.required_channels)
+        is_subscribed = await check_subscription(user_id, config.required_channels, bot=callback_query.bot)
         if not is_subscribed:
             await callback_query.answer(
                 "❌ Botdan foydalanish uchun barcha kanallarga obuna bo'lishingiz kerak.",
@@ -141,10 +139,7 @@ async def process_generate_test(callback_query: CallbackQuery, state: FSMContext
                 reply_markup=create_subscription_keyboard(config.required_channels)
             )
             return
-        user = user_cache.get(user_id)
-        if not user:
-            user = await get_user(user_id)
-            user_cache[user_id] = user
+        user = await user_cache.get_or_load(user_id, get_user_snapshot)
         if not user:
             await callback_query.message.edit_text(
                 "❌ Foydalanuvchi ma'lumotlari topilmadi.",
@@ -155,7 +150,7 @@ async def process_generate_test(callback_query: CallbackQuery, state: FSMContext
         test_limit = user["test_limit"] or 30
         is_premium = user["is_premium"]
         if tests_generated >= test_limit and not is_premium:
-            stars = await get_user_stars(user_id) or 0
+            stars = user["stars"]
             stars_cost = 100
             stars_discount = 10
             discounted_cost = stars_cost - stars_discount
@@ -212,10 +207,7 @@ async def process_skip_description(callback_query: CallbackQuery, state: FSMCont
     user_id = callback_query.from_user.id
     try:
         await state.update_data(description="")
-        user = user_cache.get(user_id)
-        if not user:
-            user = await get_user(user_id)
-            user_cache[user_id] = user
+        user = await user_cache.get_or_load(user_id, get_user_snapshot)
         if not user:
             await callback_query.message.edit_text(
                 "❌ Foydalanuvchi ma'lumotlari topilmadi.",
@@ -244,10 +236,7 @@ async def process_description(message: Message, state: FSMContext):
             await message.answer("❌ Tavsif 500 belgidan oshmasligi kerak.")
             return
         await state.update_data(description=description)
-        user = user_cache.get(user_id)
-        if not user:
-            user = await get_user(user_id)
-            user_cache[user_id] = user
+        user = await user_cache.get_or_load(user_id, get_user_snapshot)
         if not user:
             await message.answer("❌ Foydalanuvchi ma'lumotlari topilmadi.")
             return
@@ -267,10 +256,7 @@ async def process_questions_count(message: Message, state: FSMContext):
     user_id = message.from_user.id
     try:
         questions_count = int(message.text.strip())
-        user = user_cache.get(user_id)
-        if not user:
-            user = await get_user(user_id)
-            user_cache[user_id] = user
+        user = await user_cache.get_or_load(user_id, get_user_snapshot)
         if not user:
             await message.answer("❌ Foydalanuvchi ma'lumotlari topilmadi.")
             return
@@ -285,49 +271,20 @@ async def process_questions_count(message: Message, state: FSMContext):
             await message.answer("❌ Fan nomini kiriting.")
             await state.set_state(TestGeneration.waiting_for_subject)
             return
-        await message.answer("🚀 Test soniyalar ichida tayyor bo'ladi, kutishga xojat yo'q!")
-        await message.bot.send_chat_action(message.chat.id, ChatAction.TYPING)
-        earned_stars = 2 if questions_count <= 10 else 5 if questions_count <= 20 else 10
-        test_file = await generate_test_document(subject, description, questions_count)
-        if not test_file:
-            raise Exception("Failed to generate test document")
-        await update_test_count(user_id)
-        await save_test_info(user_id, subject, description, questions_count)
-        await message.bot.send_chat_action(message.chat.id, ChatAction.UPLOAD_DOCUMENT)
-        with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as temp_file:
-            temp_filename = temp_file.name
-            temp_file.write(test_file.getvalue())
-        try:
-            with open(temp_filename, 'rb') as file:
-                await message.answer_document(
-                    document=BufferedInputFile(file.read(), filename=f"{subject}_test.docx"),
-                    caption=(
-                        f"✅ {subject} bo'yicha test\n"
-                        f"📊 {questions_count} ta savol\n"
-                        f"❗️ Test yaratildi."
-                    )
-                )
-            if earned_stars > 0:
-                await add_user_stars(user_id, earned_stars)
-                current_stars = await get_user_stars(user_id) or 0
-                await message.answer(
-                    f"✨ Tabriklaymiz! {earned_stars} ta yulduz qo'shildi.\n"
-                    f"💫 Jami yulduzlaringiz: {current_stars}\n\n"
-                    f"ℹ️ Premium olish uchun {100 - current_stars} ta yulduz kerak bo'ladi."
-                )
-            is_premium = user["is_premium"]
-            premium_text = "Siz Premium foydalanuvchisiz! 💎" if is_premium else f"Qolgan bepul testlar: {max(0, user['test_limit'] - user['test_count'] - 1)} ta"
-            await message.answer(
-                f"📋 Test yaratish muvaffaqiyatli yakunlandi!\n"
-                f"{premium_text}\n\n"
-                "Yana test yaratishni xohlaysizmi?",
-                reply_markup=create_main_keyboard()
+        progress_message = await message.answer("📥 So'rovingiz qabul qilindi, test navbatga qo'yilmoqda...")
+        position = await generation_workers.enqueue(
+            user_id, message.chat.id, progress_message.message_id,
+            subject, description, questions_count, bool(user["is_premium"])
+        )
+        if position is None:
+            await progress_message.edit_text(
+                "⏳ Sizning oldingi testingiz hali tayyorlanmoqda. U tayyor bo'lgach, yangisini yaratishingiz mumkin."
             )
-        finally:
-            try:
-                os.unlink(temp_filename)
-            except Exception as e:
-                logger.error(f"Error deleting temp file for user {user_id}: {e}", exc_info=True)
+            return
+        await progress_message.edit_text(
+            f"🚀 Test navbatga qo'yildi! Navbatdagi o'rningiz: {position}.\n"
+            "Test tayyor bo'lishi bilan shu yerga yuboriladi."
+        )
     except ValueError:
         await message.answer("❌ Iltimos, to'g'ri son kiriting.")
     except Exception as e:
@@ -343,11 +300,8 @@ async def process_questions_count(message: Message, state: FSMContext):
 async def process_premium(callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
     try:
-        user = user_cache.get(user_id)
-        if not user:
-            user = await get_user(user_id)
-            user_cache[user_id] = user
-        stars = await get_user_stars(user_id) or 0
+        user = await user_cache.get_or_load(user_id, get_user_snapshot)
+        stars = user["stars"] if user else 0
         stars_cost = 100
         stars_discount = 10
         discounted_cost = stars_cost - stars_discount
@@ -645,10 +599,7 @@ async def process_pre_checkout_query(pre_checkout_query: PreCheckoutQuery):
 
 async def notify_admins_about_payment(bot, user_id, payment_info):
     try:
-        user = user_cache.get(user_id)
-        if not user:
-            user = await get_user(user_id)
-            user_cache[user_id] = user
+        user = await user_cache.get_or_load(user_id, get_user_snapshot)
         username = user["username"] if user else "Noma'lum"
         full_name = user["full_name"] if user else "Noma'lum"
         notification_text = (
@@ -796,16 +747,12 @@ async def process_help(callback_query: CallbackQuery):
 async def process_profile(callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
     try:
-        user = user_cache.get(user_id)
-        if not user:
-            user = await get_user(user_id)
-            user_cache[user_id] = user
+        user = await user_cache.get_or_load(user_id, get_user_snapshot)
         if not user:
             await callback_query.answer("❌ Profil ma'lumotlari topilmadi", show_alert=True)
             return
-        stars = await get_user_stars(user_id) or 0
-        tests = await get_user_tests(user_id)
-        total_tests = len(tests) if tests else 0
+        stars = user["stars"]
+        total_tests = user["total_tests"]
         status = "💎 Premium" if user["is_premium"] else "🔹 Oddiy"
         test_limit = "♾️ Cheksiz" if user["is_premium"] else f"📊 {user['test_limit']} ta"
         profile_text = (
@@ -829,28 +776,60 @@ async def process_profile(callback_query: CallbackQuery):
             reply_markup=create_contact_admin_keyboard()
         )
 
+async def render_my_tests_page(callback_query: CallbackQuery, page, cursor=None):
+    user_id = callback_query.from_user.id
+    user = await user_cache.get_or_load(user_id, get_user_snapshot)
+    total_tests = user["test_count"] if user else 0
+    if not total_tests:
+        await callback_query.message.edit_text(
+            "📝 Siz hali hech qanday test yaratmagansiz.",
+            reply_markup=create_back_keyboard()
+        )
+        return
+    total_pages = math.ceil(total_tests / TESTS_PAGE_SIZE)
+    page = max(1, min(page, total_pages)) if cursor else 1
+    tests, prev_cursor, next_cursor = await get_user_tests_page(user_id, TESTS_PAGE_SIZE, cursor)
+    if not tests:
+        page = 1
+        tests, prev_cursor, next_cursor = await get_user_tests_page(user_id, TESTS_PAGE_SIZE)
+    text = f"📚 Yaratilgan testlar ({page}/{total_pages}):\n\n"
+    for i, test in enumerate(tests, (page - 1) * TESTS_PAGE_SIZE + 1):
+        text += f"{i}. {test['subject']}\n"
+        text += f"   • Savollar soni: {test['questions_count']} ta\n"
+        text += f"   • Yaratilgan sana: {test['created_at'].strftime('%Y-%m-%d')}\n\n"
+    await callback_query.message.edit_text(
+        text,
+        reply_markup=create_pagination_keyboard(
+            page, total_pages, "my_tests",
+            prev_cursor=prev_cursor, next_cursor=next_cursor, back_callback="back_to_main"
+        )
+    )
+
 @router.callback_query(F.data == "my_tests")
 async def process_my_tests(callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
     try:
-        tests = await get_user_tests(user_id)
-        if not tests:
-            await callback_query.message.edit_text(
-                "📝 Siz hali hech qanday test yaratmagansiz.",
-                reply_markup=create_back_keyboard()
-            )
-            return
-        text = "📚 Yaratilgan testlar:\n\n"
-        for i, test in enumerate(tests, 1):
-            text += f"{i}. {test['subject']}\n"
-            text += f"   • Savollar soni: {test['questions_count']} ta\n"
-            text += f"   • Yaratilgan sana: {test['created_at'].strftime('%Y-%m-%d')}\n\n"
+        await render_my_tests_page(callback_query, 1)
+    except Exception as e:
+        logger.error(f"Error in my_tests for user {user_id}: {e}", exc_info=True)
         await callback_query.message.edit_text(
-            text,
-            reply_markup=create_back_keyboard()
+            "Xatolik yuz berdi. Iltimos, admin bilan bog'laning: @y0rdam_42",
+            reply_markup=create_contact_admin_keyboard()
         )
+
+@router.callback_query(F.data.startswith("my_tests:page:"))
+async def process_my_tests_page(callback_query: CallbackQuery):
+    user_id = callback_query.from_user.id
+    try:
+        parts = callback_query.data.split(":")
+        page = int(parts[2])
+        cursor = parts[3] if len(parts) > 3 else None
+        await render_my_tests_page(callback_query, page, cursor)
+        await callback_query.answer()
+    except TelegramBadRequest:
+        await callback_query.answer()
     except Exception as e:
-        logger.error(f"Error in my_tests for user {user_id}: {e}", exc_info=True)
+        logger.error(f"Error in my_tests_page for user {user_id}: {e}", exc_info=True)
         await callback_query.message.edit_text(
             "Xatolik yuz berdi. Iltimos, admin bilan bog'laning: @y0rdam_42",
             reply_markup=create_contact_admin_keyboard()
@@ -72,13 +72,22 @@ def get_premium_plus_prices():
         {"label": "Bonus 10 yulduz", "amount": 5000 * 100}
     ]
 
-def create_pagination_keyboard(current_page, total_pages, prefix):
+def create_pagination_keyboard(current_page, total_pages, prefix, prev_cursor=None, next_cursor=None, back_callback=None):
     buttons = []
     if current_page > 1:
-        buttons.append(InlineKeyboardButton(text="⬅️ Oldingi", callback_data=f"{prefix}:page:{current_page - 1}"))
+        callback_data = f"{prefix}:page:{current_page - 1}"
+        if prev_cursor:
+            callback_data += f":{prev_cursor}"
+        buttons.append(InlineKeyboardButton(text="⬅️ Oldingi", callback_data=callback_data))
     if current_page < total_pages:
-        buttons.append(InlineKeyboardButton(text="Keyingi ➡️", callback_data=f"{prefix}:page:{current_page + 1}"))
-    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+        callback_data = f"{prefix}:page:{current_page + 1}"
+        if next_cursor:
+            callback_data += f":{next_cursor}"
+        buttons.append(InlineKeyboardButton(text="Keyingi ➡️", callback_data=callback_data))
+    rows = [buttons] if buttons else []
+    if back_callback:
+        rows.append([InlineKeyboardButton(text="🔙 Orqaga", callback_data=back_callback)])
+    return InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
 
 def create_broadcast_confirmation_keyboard(message_id):
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -18,7 +18,7 @@ class SubscriptionMiddleware(BaseMiddleware):
             if isinstance(event, CallbackQuery) and event.data in ["check_subscription", "back_to_main", "help", "contact_admin"]:
                 return await handler(event, data)
             try:
-                is_subscribed = await check_subscription(user_id, config.required_channels)
+                is_subscribed = await check_subscription(user_id, config.required_channels, bot=data.get("bot"))
                 if not is_subscribed:
                     text = "Botdan foydalanish uchun quyidagi kanallarga obuna bo'lishingiz kerak:"
                     if isinstance(event, Message):
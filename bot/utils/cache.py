@@ -0,0 +1,185 @@
+from cachetools import TTLCache
+from bot.utils.logger import get_logger
+from config.config import load_config
+import datetime
+import json
+
+logger = get_logger(__name__)
+config = load_config()
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"__date__": value.isoformat()}
+    raise TypeError(f"Cannot serialize {type(value).__name__} for the cache")
+
+def _json_object_hook(value):
+    if "__datetime__" in value:
+        return datetime.datetime.fromisoformat(value["__datetime__"])
+    if "__date__" in value:
+        return datetime.date.fromisoformat(value["__date__"])
+    return value
+
+def dumps(value):
+    return json.dumps(value, default=_json_default, ensure_ascii=False)
+
+def loads(raw):
+    return json.loads(raw, object_hook=_json_object_hook)
+
+class MemoryCacheBackend:
+    name = "memory"
+
+    def __init__(self, maxsize, ttl):
+        self._data = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._versions = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key):
+        return self._data.get(key)
+
+    async def set(self, key, value, ttl):
+        self._data[key] = value
+
+    async def get_version(self, key):
+        return self._versions.get(key, 0)
+
+    async def bump_version(self, key, ttl):
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    async def set_if_version(self, key, value, ttl, version):
+        if self._versions.get(key, 0) != version:
+            return False
+        self._data[key] = value
+        return True
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+    def size(self):
+        return len(self._data)
+
+# Writes the value only if the key's version is unchanged since the load began.
+SET_IF_VERSION_SCRIPT = '''
+if tonumber(redis.call("GET", KEYS[2]) or "0") == tonumber(ARGV[2]) then
+    redis.call("SET", KEYS[1], ARGV[1], "EX", ARGV[3])
+    return 1
+end
+return 0
+'''
+
+class RedisCacheBackend:
+    name = "redis"
+
+    def __init__(self, client, prefix):
+        self.client = client
+        self.prefix = prefix
+        self._set_if_version = client.register_script(SET_IF_VERSION_SCRIPT)
+
+    def _key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def _version_key(self, key):
+        return f"{self.prefix}:ver:{key}"
+
+    async def get(self, key):
+        try:
+            raw = await self.client.get(self._key(key))
+        except Exception as e:
+            logger.error(f"Redis cache get failed for {key}: {e}")
+            return None
+        return loads(raw) if raw is not None else None
+
+    async def set(self, key, value, ttl):
+        try:
+            await self.client.set(self._key(key), dumps(value), ex=ttl)
+        except Exception as e:
+            logger.error(f"Redis cache set failed for {key}: {e}")
+
+    async def delete(self, key):
+        try:
+            await self.client.delete(self._key(key))
+        except Exception as e:
+            logger.error(f"Redis cache delete failed for {key}: {e}")
+
+    async def get_version(self, key):
+        try:
+            raw = await self.client.get(self._version_key(key))
+        except Exception as e:
+            logger.error(f"Redis cache version read failed for {key}: {e}")
+            return None
+        return int(raw) if raw is not None else 0
+
+    async def bump_version(self, key, ttl):
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.incr(self._version_key(key))
+                pipe.expire(self._version_key(key), ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Redis cache version bump failed for {key}: {e}")
+
+    async def set_if_version(self, key, value, ttl, version):
+        try:
+            return bool(await self._set_if_version(
+                keys=[self._key(key), self._version_key(key)],
+                args=[dumps(value), version, ttl]
+            ))
+        except Exception as e:
+            logger.error(f"Redis cache set failed for {key}: {e}")
+            return False
+
+    def size(self):
+        return None
+
+class Cache:
+    def __init__(self, namespace, backend, ttl):
+        self.namespace = namespace
+        self.backend = backend
+        self.ttl = ttl
+
+    async def get(self, key):
+        return await self.backend.get(key)
+
+    async def set(self, key, value):
+        await self.backend.set(key, value, self.ttl)
+
+    async def delete(self, key):
+        await self.backend.delete(key)
+
+    async def get_version(self, key):
+        return await self.backend.get_version(key)
+
+    async def bump_version(self, key):
+        await self.backend.bump_version(key, self.ttl)
+
+    async def set_if_version(self, key, value, version):
+        return await self.backend.set_if_version(key, value, self.ttl, version)
+
+    def size(self):
+        return self.backend.size()
+
+_redis_client = None
+
+def get_redis_client():
+    global _redis_client
+    if _redis_client is None:
+        import redis.asyncio as redis
+        _redis_client = redis.from_url(
+            config.redis_url,
+            socket_timeout=config.redis_timeout,
+            socket_connect_timeout=config.redis_timeout
+        )
+    return _redis_client
+
+def create_cache(namespace, maxsize, ttl):
+    if config.cache_backend == "redis":
+        backend = RedisCacheBackend(get_redis_client(), f"{config.cache_prefix}:{namespace}")
+    else:
+        backend = MemoryCacheBackend(maxsize, ttl)
+    return Cache(namespace, backend, ttl)
+
+async def close_caches():
+    global _redis_client
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
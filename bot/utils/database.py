@@ -1,255 +1,348 @@
 import asyncpg
 from bot.utils.logger import get_logger
+from bot.utils.queries import QUERIES
+from bot.utils.user_cache import user_cache
 from config.config import load_config
+from contextlib import asynccontextmanager
 import datetime
+import json
+import time
 import uuid
 
 logger = get_logger(__name__)
 config = load_config()
+MIN_BIGINT = -2 ** 63
+CURSOR_EPOCH = datetime.datetime(1970, 1, 1)
 
-async def init_db():
-    try:
-        pool = await asyncpg.create_pool(
-            user=config.db_user,
-            password=config.db_password,
-            database=config.db_name,
-            host=config.db_host,
-            port=config.db_port
+class StatementConnection(asyncpg.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.named_statements = {}
+
+    async def named(self, name):
+        statement = self.named_statements.get(name)
+        if statement is None:
+            statement = await self.prepare(QUERIES[name])
+            self.named_statements[name] = statement
+        return statement
+
+    async def warm_statements(self):
+        for name in QUERIES:
+            await self.named(name)
+
+    async def execute_named(self, name, *args):
+        await (await self.named(name)).fetch(*args)
+
+    async def fetch_named(self, name, *args):
+        return await (await self.named(name)).fetch(*args)
+
+    async def fetchrow_named(self, name, *args):
+        return await (await self.named(name)).fetchrow(*args)
+
+    async def fetchval_named(self, name, *args):
+        return await (await self.named(name)).fetchval(*args)
+
+class Database:
+    def __init__(self):
+        self.pool = None
+        self.acquire_count = 0
+        self.acquire_total_time = 0.0
+        self.acquire_max_time = 0.0
+
+    async def connect(self):
+        if self.pool:
+            return self.pool
+        self.pool = await asyncpg.create_pool(
+            **self.connect_kwargs(),
+            min_size=config.db_pool_min_size,
+            max_size=config.db_pool_max_size,
+            connection_class=StatementConnection,
+            init=self._init_connection
         )
-        async with pool.acquire() as conn:
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id BIGINT PRIMARY KEY,
-                    username TEXT,
-                    full_name TEXT,
-                    is_premium BOOLEAN DEFAULT FALSE,
-                    test_count INTEGER DEFAULT 0,
-                    test_limit INTEGER DEFAULT 30,
-                    registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_admin BOOLEAN DEFAULT FALSE
-                );
-                CREATE INDEX IF NOT EXISTS idx_users_id ON users(id);
-            ''')
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS tests (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT REFERENCES users(id),
-                    subject TEXT,
-                    description TEXT,
-                    questions_count INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                CREATE INDEX IF NOT EXISTS idx_tests_user_id ON tests(user_id);
-            ''')
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS stars (
-                    user_id BIGINT PRIMARY KEY REFERENCES users(id),
-                    stars INTEGER DEFAULT 0
-                );
-            ''')
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS payments (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT REFERENCES users(id),
-                    amount FLOAT,
-                    payment_type TEXT,
-                    currency TEXT,
-                    status TEXT,
-                    payment_id TEXT UNIQUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                CREATE INDEX IF NOT EXISTS idx_payments_user_id ON payments(user_id);
-            ''')
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS promo_codes (
-                    code TEXT PRIMARY KEY,
-                    duration_days INTEGER,
-                    used_by BIGINT REFERENCES users(id),
-                    used_at TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            ''')
-        return pool
-    except Exception as e:
-        logger.error(f"Error initializing database: {e}", exc_info=True)
-        raise
+        logger.info(f"Database pool created (min={config.db_pool_min_size}, max={config.db_pool_max_size})")
+        return self.pool
+
+    def connect_kwargs(self):
+        return {
+            "user": config.db_user,
+            "password": config.db_password,
+            "database": config.db_name,
+            "host": config.db_host,
+            "port": config.db_port
+        }
+
+    async def _init_connection(self, conn):
+        try:
+            await conn.warm_statements()
+        except asyncpg.PostgresError as e:
+            logger.error(f"Error preparing statements for new connection: {e}", exc_info=True)
+
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+            logger.info("Database pool closed")
+
+    @asynccontextmanager
+    async def acquire(self):
+        if not self.pool:
+            raise RuntimeError("Database pool is not initialized")
+        start = time.perf_counter()
+        async with self.pool.acquire() as conn:
+            elapsed = time.perf_counter() - start
+            self.acquire_count += 1
+            self.acquire_total_time += elapsed
+            self.acquire_max_time = max(self.acquire_max_time, elapsed)
+            yield conn
+
+    def get_pool_stats(self):
+        avg = self.acquire_total_time / self.acquire_count if self.acquire_count else 0.0
+        return {
+            "size": self.pool.get_size() if self.pool else 0,
+            "idle": self.pool.get_idle_size() if self.pool else 0,
+            "acquire_count": self.acquire_count,
+            "acquire_avg_ms": avg * 1000,
+            "acquire_max_ms": self.acquire_max_time * 1000
+        }
+
+db = Database()
 
 async def register_user(user_id, username, full_name):
-    async with (await init_db()).acquire() as conn:
-        async with conn.transaction():
-            await conn.execute(
-                '''
-                INSERT INTO users (id, username, full_name)
-                VALUES ($1, $2, $3)
-                ON CONFLICT (id) DO UPDATE
-                SET username = EXCLUDED.username, full_name = EXCLUDED.full_name
-                ''',
-                user_id, username, full_name
-            )
+    async with db.acquire() as conn:
+        await conn.execute_named("register_user", user_id, username, full_name)
+    await user_cache.invalidate(user_id)
 
 async def get_user(user_id):
-    async with (await init_db()).acquire() as conn:
-        return await conn.fetchrow('SELECT * FROM users WHERE id = $1', user_id)
+    async with db.acquire() as conn:
+        return await conn.fetchrow_named("get_user", user_id)
 
-async def update_test_count(user_id):
-    async with (await init_db()).acquire() as conn:
-        async with conn.transaction():
-            await conn.execute(
-                'UPDATE users SET test_count = test_count + 1 WHERE id = $1',
-                user_id
-            )
+async def get_user_snapshot(user_id):
+    async with db.acquire() as conn:
+        return await conn.fetchrow_named("get_user_snapshot", user_id)
 
-async def save_test_info(user_id, subject, description, questions_count):
-    async with (await init_db()).acquire() as conn:
-        async with conn.transaction():
-            await conn.execute(
-                '''
-                INSERT INTO tests (user_id, subject, description, questions_count)
-                VALUES ($1, $2, $3, $4)
-                ''',
-                user_id, subject, description, questions_count
-            )
+async def record_test_completion(user_id, subject, description, questions_count, stars):
+    async with db.acquire() as conn:
+        result = await conn.fetchrow_named(
+            "record_test_completion",
+            user_id, subject, description, questions_count, stars
+        )
+    await user_cache.invalidate(user_id)
+    return result
 
 async def get_user_tests(user_id, limit=None):
-    async with (await init_db()).acquire() as conn:
-        query = 'SELECT * FROM tests WHERE user_id = $1 ORDER BY created_at DESC'
-        if limit:
-            query += f' LIMIT {limit}'
-        return await conn.fetch(query, user_id)
+    async with db.acquire() as conn:
+        return await conn.fetch_named("get_user_tests", user_id, limit)
+
+def encode_test_cursor(test, direction):
+    micros = (test["created_at"] - CURSOR_EPOCH) // datetime.timedelta(microseconds=1)
+    return f"{direction}{micros}_{test['id']}"
+
+def decode_test_cursor(cursor):
+    direction = cursor[0]
+    micros, test_id = cursor[1:].split("_")
+    created_at = CURSOR_EPOCH + datetime.timedelta(microseconds=int(micros))
+    return direction, created_at, int(test_id)
+
+async def get_user_tests_page(user_id, page_size, cursor=None):
+    # "n" cursors page to older rows, "p" cursors to newer ones.
+    async with db.acquire() as conn:
+        if not cursor:
+            rows = await conn.fetch_named("get_user_tests_first_page", user_id, page_size)
+        else:
+            direction, created_at, test_id = decode_test_cursor(cursor)
+            if direction == "p":
+                rows = await conn.fetch_named("get_user_tests_before", user_id, created_at, test_id, page_size)
+                rows = list(reversed(rows))
+            else:
+                rows = await conn.fetch_named("get_user_tests_after", user_id, created_at, test_id, page_size)
+    prev_cursor = encode_test_cursor(rows[0], "p") if rows else None
+    next_cursor = encode_test_cursor(rows[-1], "n") if rows else None
+    return rows, prev_cursor, next_cursor
 
 async def get_user_stars(user_id):
-    async with (await init_db()).acquire() as conn:
-        result = await conn.fetchrow('SELECT stars FROM stars WHERE user_id = $1', user_id)
+    async with db.acquire() as conn:
+        result = await conn.fetchrow_named("get_user_stars", user_id)
         return result['stars'] if result else 0
 
 async def add_user_stars(user_id, stars):
-    async with (await init_db()).acquire() as conn:
-        async with conn.transaction():
-            await conn.execute(
-                '''
-                INSERT INTO stars (user_id, stars)
-                VALUES ($1, $2)
-                ON CONFLICT (user_id) DO UPDATE
-                SET stars = stars.stars + $2
-                ''',
-                user_id, stars
-            )
+    async with db.acquire() as conn:
+        await conn.execute_named("add_user_stars", user_id, stars)
+    await user_cache.invalidate(user_id)
 
 async def spend_stars_for_premium(user_id, stars_cost):
-    async with (await init_db()).acquire() as conn:
-        async with conn.transaction():
-            current_stars = await get_user_stars(user_id)
-            if current_stars < stars_cost:
-                return False, "Yetarli yulduzlar yo'q"
-            await conn.execute(
-                'UPDATE stars SET stars = stars - $2 WHERE user_id = $1',
-                user_id, stars_cost
-            )
-            await conn.execute(
-                'UPDATE users SET is_premium = TRUE, test_limit = NULL WHERE id = $1',
-                user_id
-            )
-            return True, "Muvaffaqiyatli"
+    # One conditional statement, so concurrent clicks cannot spend the stars twice.
+    async with db.acquire() as conn:
+        result = await conn.fetchrow_named("spend_stars_for_premium", user_id, stars_cost)
+    if not result:
+        return False, "Yetarli yulduzlar yo'q"
+    await user_cache.invalidate(user_id)
+    return True, "Muvaffaqiyatli"
 
 async def set_premium_status(user_id, status):
-    async with (await init_db()).acquire() as conn:
-        async with conn.transaction():
-            await conn.execute(
-                'UPDATE users SET is_premium = $2, test_limit = NULL WHERE id = $1',
-                user_id, status
-            )
+    async with db.acquire() as conn:
+        await conn.execute_named("set_premium_status", user_id, status)
+    await user_cache.invalidate(user_id)
 
 async def record_payment(user_id, amount, payment_type, currency, status, payment_id):
-    async with (await init_db()).acquire() as conn:
-        async with conn.transaction():
-            await conn.execute(
-                '''
-                INSERT INTO payments (user_id, amount, payment_type, currency, status, payment_id)
-                VALUES ($1, $2, $3, $4, $5, $6)
-                ''',
-                user_id, amount, payment_type, currency, status, payment_id
-            )
+    async with db.acquire() as conn:
+        await conn.execute_named(
+            "record_payment",
+            user_id, amount, payment_type, currency, status, payment_id
+        )
 
 async def update_payment_status(payment_id, status):
-    async with (await init_db()).acquire() as conn:
-        async with conn.transaction():
-            await conn.execute(
-                'UPDATE payments SET status = $2 WHERE payment_id = $1',
-                payment_id, status
-            )
-
-async def get_all_users():
-    async with (await init_db()).acquire() as conn:
-        return await conn.fetch('SELECT * FROM users')
-
-async def get_user_stats():
-    async with (await init_db()).acquire() as conn:
-        total_users = await conn.fetchval('SELECT COUNT(*) FROM users')
-        premium_users = await conn.fetchval('SELECT COUNT(*) FROM users WHERE is_premium = TRUE')
-        total_tests = await conn.fetchval('SELECT COUNT(*) FROM tests')
-        total_stars = await conn.fetchval('SELECT SUM(stars) FROM stars') or 0
+    async with db.acquire() as conn:
+        await conn.execute_named("update_payment_status", payment_id, status)
+
+async def count_users():
+    async with db.acquire() as conn:
+        return await conn.fetchval_named("count_users") or 0
+
+async def iter_user_ids(batch_size=1000):
+    last_id = MIN_BIGINT
+    while True:
+        async with db.acquire() as conn:
+            rows = await conn.fetch_named("get_user_ids_batch", last_id, batch_size)
+        if not rows:
+            return
+        for row in rows:
+            yield row["id"]
+        last_id = rows[-1]["id"]
+        if len(rows) < batch_size:
+            return
+
+async def get_user_stats(trend_days=7):
+    async with db.acquire() as conn:
+        totals = await conn.fetchrow_named("get_bot_stats")
+        trend = await conn.fetchrow_named("get_daily_stats", trend_days)
         return {
-            "total_users": total_users,
-            "premium_users": premium_users,
-            "total_tests": total_tests,
-            "total_stars": total_stars
+            "total_users": totals["total_users"] if totals else 0,
+            "premium_users": totals["premium_users"] if totals else 0,
+            "total_tests": totals["total_tests"] if totals else 0,
+            "total_stars": totals["total_stars"] if totals else 0,
+            "trend_days": trend_days,
+            "new_users_today": trend["new_users_today"],
+            "tests_today": trend["tests_today"],
+            "new_users_period": trend["new_users_period"],
+            "premium_activations_period": trend["premium_activations_period"],
+            "tests_period": trend["tests_period"],
+            "stars_earned_period": trend["stars_earned_period"]
         }
 
 async def get_top_users(limit=10):
-    async with (await init_db()).acquire() as conn:
-        return await conn.fetch(
-            'SELECT * FROM users ORDER BY test_count DESC LIMIT $1',
-            limit
-        )
+    async with db.acquire() as conn:
+        return await conn.fetch_named("get_top_users", limit)
 
 async def update_user_limit(user_id, new_limit):
-    async with (await init_db()).acquire() as conn:
-        async with conn.transaction():
-            await conn.execute(
-                'UPDATE users SET test_limit = $2 WHERE id = $1',
-                user_id, new_limit
-            )
+    async with db.acquire() as conn:
+        await conn.execute_named("update_user_limit", user_id, new_limit)
+    await user_cache.invalidate(user_id)
 
-async def save_promo_code(code, duration_days):
-    async with (await init_db()).acquire() as conn:
+def generate_promo_code():
+    return str(uuid.uuid4())[:8].upper()
+
+async def save_promo_codes_bulk(codes, duration_days, max_retries=5):
+    saved = []
+    pending = list(dict.fromkeys(codes))
+    async with db.acquire() as conn:
         async with conn.transaction():
-            await conn.execute(
-                '''
-                INSERT INTO promo_codes (code, duration_days)
-                VALUES ($1, $2)
-                ''',
-                code, duration_days
-            )
+            for _ in range(max_retries + 1):
+                rows = await conn.fetch_named("save_promo_codes_bulk", pending, duration_days)
+                saved.extend(row["code"] for row in rows)
+                missing = len(codes) - len(saved)
+                if missing <= 0:
+                    break
+                taken = set(saved)
+                pending = []
+                while len(pending) < missing:
+                    code = generate_promo_code()
+                    if code not in taken and code not in pending:
+                        pending.append(code)
+            else:
+                logger.error(f"Could not generate {len(codes) - len(saved)} unique promo codes after {max_retries} retries")
+    return saved
 
 async def use_promo_code(code, user_id):
-    async with (await init_db()).acquire() as conn:
-        async with conn.transaction():
-            promo = await conn.fetchrow(
-                'SELECT * FROM promo_codes WHERE code = $1 AND used_by IS NULL',
-                code
-            )
-            if not promo:
-                return False, "Promo kod topilmadi yoki allaqachon ishlatilgan"
-            await conn.execute(
-                '''
-                UPDATE promo_codes
-                SET used_by = $2, used_at = CURRENT_TIMESTAMP
-                WHERE code = $1
-                ''',
-                code, user_id
-            )
-            await set_premium_status(user_id, True)
-            return True, "Muvaffaqiyatli"
+    async with db.acquire() as conn:
+        result = await conn.fetchrow_named("use_promo_code", code, user_id)
+    if not result:
+        return False, "Promo kod topilmadi yoki allaqachon ishlatilgan"
+    await user_cache.invalidate(user_id)
+    return True, "Muvaffaqiyatli"
+
+async def get_topic_questions(topic_key):
+    async with db.acquire() as conn:
+        rows = await conn.fetch_named("get_topic_questions", topic_key)
+        return [json.loads(row["question"]) for row in rows]
+
+async def save_topic_questions(topic_key, subject, topic, hashed_questions):
+    if not hashed_questions:
+        return
+    async with db.acquire() as conn:
+        await conn.execute_named(
+            "save_topic_questions",
+            topic_key, subject, topic,
+            [question_hash for question_hash, _ in hashed_questions],
+            [json.dumps(question, ensure_ascii=False) for _, question in hashed_questions]
+        )
+
+async def get_channel_memberships(user_id, channel_ids, max_age):
+    async with db.acquire() as conn:
+        rows = await conn.fetch_named("get_channel_memberships", user_id, list(channel_ids), max_age)
+        return {row["channel_id"]: row["status"] for row in rows}
+
+async def save_channel_memberships(user_id, statuses):
+    if not statuses:
+        return
+    async with db.acquire() as conn:
+        await conn.execute_named(
+            "save_channel_memberships",
+            user_id, list(statuses.keys()), list(statuses.values())
+        )
 
 async def set_admin_status(user_id, status):
-    async with (await init_db()).acquire() as conn:
-        async with conn.transaction():
-            await conn.execute(
-                'UPDATE users SET is_admin = $2 WHERE id = $1',
-                user_id, status
-            )
+    async with db.acquire() as conn:
+        await conn.execute_named("set_admin_status", user_id, status)
+    await user_cache.invalidate(user_id)
 
 async def check_is_admin(user_id):
-    async with (await init_db()).acquire() as conn:
-        result = await conn.fetchrow('SELECT is_admin FROM users WHERE id = $1', user_id)
+    async with db.acquire() as conn:
+        result = await conn.fetchrow_named("check_is_admin", user_id)
         return result['is_admin'] if result else False
+
+async def enqueue_generation_job(user_id, chat_id, progress_message_id, subject, description, questions_count, is_premium):
+    # Returns None when the user already has a queued or running job.
+    async with db.acquire() as conn:
+        return await conn.fetchval_named(
+            "enqueue_generation_job",
+            user_id, chat_id, progress_message_id, subject, description, questions_count, is_premium
+        )
+
+async def get_generation_queue_position(job_id):
+    async with db.acquire() as conn:
+        return await conn.fetchval_named("get_generation_queue_position", job_id) or 0
+
+async def claim_generation_job():
+    async with db.acquire() as conn:
+        return await conn.fetchrow_named("claim_generation_job")
+
+async def finish_generation_job(job_id):
+    async with db.acquire() as conn:
+        await conn.execute_named("finish_generation_job", job_id)
+
+async def fail_generation_job(job_id, error, max_attempts):
+    async with db.acquire() as conn:
+        return await conn.fetchval_named("fail_generation_job", job_id, error, max_attempts)
+
+async def requeue_generation_job(job_id):
+    async with db.acquire() as conn:
+        await conn.execute_named("requeue_generation_job", job_id)
+
+async def requeue_stale_generation_jobs(stale_after):
+    async with db.acquire() as conn:
+        rows = await conn.fetch_named("requeue_stale_generation_jobs", stale_after)
+        return len(rows)
+
+async def count_queued_generation_jobs():
+    async with db.acquire() as conn:
+        return await conn.fetchval_named("count_queued_generation_jobs") or 0
@@ -1,82 +1,435 @@
-import aiohttp
 import io
 import docx
 from docx.shared import Inches
 from bot.utils.logger import get_logger
 from config.config import load_config
-from cachetools import TTLCache
+from bot.utils.cache import create_cache
+from bot.utils.database import get_topic_questions, save_topic_questions
+from bot.utils.llm_providers import llm_router
+from bot.utils.llm_scheduler import llm_scheduler
 import asyncio
+import hashlib
 import random
 import json
 
 logger = get_logger(__name__)
 config = load_config()
-question_cache = TTLCache(maxsize=1000, ttl=3600)
+question_cache = create_cache("questions", maxsize=1000, ttl=3600)
+generation_stats = {"generations": 0, "coalesced": 0}
 
-async def generate_test_questions(subject, description, questions_count):
-    cache_key = f"{subject}:{description}:{questions_count}"
-    cached_questions = question_cache.get(cache_key)
+FALLBACK_QUESTIONS = {
+    "Matematika": [
+        {"question": "2 + 2 = ?", "options": ["3", "4", "5", "6"], "answer": "4"},
+        {"question": "x^2 - 4 = 0 tenglamaning yechimi nima?", "options": ["x = ±2", "x = ±4", "x = 0", "x = ±1"], "answer": "x = ±2"}
+    ],
+    "Tarix": [
+        {"question": "Ikkinchi jahon urushi qachon boshlangan?", "options": ["1939", "1941", "1945", "1935"], "answer": "1939"},
+        {"question": "Amir Temur qachon tug'ilgan?", "options": ["1336", "1340", "1320", "1350"], "answer": "1336"}
+    ],
+    "Biologiya": [
+        {"question": "DNK molekulasining asosiy vazifasi nima?", "options": ["Energiya saqlash", "Ma'lumot saqlash", "Transport", "Struktura"], "answer": "Ma'lumot saqlash"},
+        {"question": "Fotosintez jarayoni qayerda sodir bo'ladi?", "options": ["Mitoxondriya", "Xloroplast", "Yadro", "Ribosoma"], "answer": "Xloroplast"}
+    ]
+}
+
+def normalize_text(value):
+    return " ".join((value or "").lower().split())
+
+def topic_key(subject, description):
+    raw = f"{normalize_text(subject)}\x1f{normalize_text(description)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def question_hash(question):
+    # Must match the md5 used when migrating question_sets in 0006.
+    return hashlib.md5(normalize_text(question.get("question", "")).encode("utf-8")).hexdigest()
+
+def unique_questions(questions, seen=None):
+    seen = set() if seen is None else seen
+    result = []
+    for question in questions:
+        key = question_hash(question)
+        if key in seen:
+            continue
+        seen.add(key)
+        result.append(question)
+    return result
+
+def fallback_sample(subject, count):
+    available_questions = FALLBACK_QUESTIONS.get(subject.capitalize(), [])
+    return random.sample(available_questions, min(count, len(available_questions)))
+
+async def load_topic_questions(key):
+    cached_questions = await question_cache.get(key)
     if cached_questions:
         return cached_questions
-    fallback_questions = {
-        "Matematika": [
-            {"question": "2 + 2 = ?", "options": ["3", "4", "5", "6"], "answer": "4"},
-            {"question": "x^2 - 4 = 0 tenglamaning yechimi nima?", "options": ["x = ±2", "x = ±4", "x = 0", "x = ±1"], "answer": "x = ±2"}
-        ],
-        "Tarix": [
-            {"question": "Ikkinchi jahon urushi qachon boshlangan?", "options": ["1939", "1941", "1945", "1935"], "answer": "1939"},
-            {"question": "Amir Temur qachon tug'ilgan?", "options": ["1336", "1340", "1320", "1350"], "answer": "1336"}
-        ],
-        "Biologiya": [
-            {"question": "DNK molekulasining asosiy vazifasi nima?", "options": ["Energiya saqlash", "Ma'lumot saqlash", "Transport", "Struktura"], "answer": "Ma'lumot saqlash"},
-            {"question": "Fotosintez jarayoni qayerda sodir bo'ladi?", "options": ["Mitoxondriya", "Xloroplast", "Yadro", "Ribosoma"], "answer": "Xloroplast"}
-        ]
-    }
     try:
-        prompt = (
-            f"Create {questions_count} multiple-choice test questions in Uzbek for the subject '{subject}'"
-            f"{f' with the topic: {description}' if description else ''}. "
-            "Each question should have 4 options and one correct answer. "
-            "Return the result as a JSON list where each item has 'question', 'options' (list), and 'answer' fields."
+        stored_questions = await get_topic_questions(key)
+    except Exception as e:
+        logger.error(f"Error loading questions for topic {key}: {e}", exc_info=True)
+        return []
+    if stored_questions:
+        await question_cache.set(key, stored_questions)
+    return stored_questions
+
+async def store_topic_questions(key, subject, description, known_questions, new_questions):
+    await question_cache.set(key, known_questions + new_questions)
+    try:
+        await save_topic_questions(
+            key, normalize_text(subject), normalize_text(description),
+            [(question_hash(q), q) for q in new_questions]
         )
-        headers = {
-            "Authorization": f"Bearer {config.openrouter_api_key}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "model": "deepseek/deepseek-prover-v2:free",
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": 4096,
-            "temperature": 0.7
-        }
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                json=payload,
-                headers=headers
-            ) as response:
-                if response.status != 200:
-                    logger.error(f"OpenRouter API error: {response.status} - {await response.text()}")
-                    subject_key = subject.capitalize()
-                    available_questions = fallback_questions.get(subject_key, [])
-                    return random.sample(available_questions, min(questions_count, len(available_questions)))
-                result = await response.json()
-                questions_text = result["choices"][0]["message"]["content"]
-                questions = json.loads(questions_text)
-                if len(questions) < questions_count:
-                    subject_key = subject.capitalize()
-                    available_questions = fallback_questions.get(subject_key, [])
-                    questions.extend(random.sample(available_questions, min(questions_count - len(questions), len(available_questions))))
-                question_cache[cache_key] = questions
-                return questions
     except Exception as e:
-        logger.error(f"Error generating questions: {e}", exc_info=True)
-        subject_key = subject.capitalize()
-        available_questions = fallback_questions.get(subject_key, [])
-        return random.sample(available_questions, min(questions_count, len(available_questions)))
+        logger.error(f"Error saving questions for topic {key}: {e}", exc_info=True)
+
+class QuestionStreamParser:
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.object_start = None
+
+    def feed(self, text):
+        self.buffer += text
+        objects = []
+        while self.position < len(self.buffer):
+            char = self.buffer[self.position]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = self.depth > 0
+            elif char in "[{":
+                if char == "{" and self.depth == 1:
+                    self.object_start = self.position
+                self.depth += 1
+            elif char in "]}" and self.depth > 0:
+                self.depth -= 1
+                if char == "}" and self.depth == 1 and self.object_start is not None:
+                    try:
+                        objects.append(json.loads(self.buffer[self.object_start:self.position + 1]))
+                    except json.JSONDecodeError as e:
+                        logger.error(f"Skipping malformed question in LLM output: {e}")
+                    self.object_start = None
+            self.position += 1
+        if self.object_start is None and self.depth <= 1:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+        return objects
+
+def is_valid_question(question):
+    return (
+        isinstance(question, dict)
+        and isinstance(question.get("question"), str)
+        and isinstance(question.get("options"), list)
+        and "answer" in question
+    )
+
+async def request_questions(subject, description, questions_count, on_question=None, part=None, user_id=None, premium=False):
+    prompt = (
+        f"Create {questions_count} multiple-choice test questions in Uzbek for the subject '{subject}'"
+        f"{f' with the topic: {description}' if description else ''}. "
+        "Each question should have 4 options and one correct answer. "
+        "Return the result as a JSON list where each item has 'question', 'options' (list), and 'answer' fields."
+    )
+    if part:
+        prompt += (
+            f" This is part {part[0]} of {part[1]} of a larger test; focus on different aspects "
+            "of the topic than the other parts so the questions do not repeat."
+        )
+    return await stream_questions(prompt, on_question, user_id, premium)
+
+async def stream_questions(prompt, on_question=None, user_id=None, premium=False):
+    parser = QuestionStreamParser()
+    questions = []
+
+    async def collect(text):
+        for question in parser.feed(text):
+            if not is_valid_question(question):
+                continue
+            questions.append(question)
+            if on_question:
+                await on_question(question)
+
+    async with llm_scheduler.slot(user_id, premium):
+        await llm_router.complete(prompt, collect)
+    return questions
+
+def split_into_chunks(total, chunk_size):
+    chunks_count = max(1, -(-total // chunk_size))
+    base, extra = divmod(total, chunks_count)
+    return [base + (1 if i < extra else 0) for i in range(chunks_count)]
+
+async def request_questions_chunked(subject, description, questions_count, on_question=None, user_id=None, premium=False):
+    semaphore = asyncio.Semaphore(config.llm_chunk_concurrency)
+
+    async def run_round(count):
+        chunks = split_into_chunks(count, config.llm_chunk_size)
+
+        async def run_chunk(index, size):
+            async with semaphore:
+                return await request_questions(
+                    subject, description, size, on_question,
+                    part=(index + 1, len(chunks)) if len(chunks) > 1 else None,
+                    user_id=user_id, premium=premium
+                )
+
+        results = await asyncio.gather(
+            *(run_chunk(i, size) for i, size in enumerate(chunks)),
+            return_exceptions=True
+        )
+        questions = []
+        errors = []
+        for result in results:
+            if isinstance(result, Exception):
+                errors.append(result)
+            else:
+                questions.extend(result)
+        for error in errors:
+            logger.error(f"Question chunk failed: {error}")
+        return questions, errors
+
+    questions, errors = await run_round(questions_count)
+    if errors and not questions:
+        raise errors[0]
+    questions = unique_questions(questions)
+    missing = questions_count - len(questions)
+    if missing > 0:
+        extra, _ = await run_round(missing)
+        questions.extend(unique_questions(extra, {question_hash(q) for q in questions}))
+    return questions
+
+class GenerationFlight:
+    def __init__(self, known_count):
+        self.future = asyncio.get_running_loop().create_future()
+        self.known_count = known_count
+        self.received = 0
+        self.listeners = []
+
+    async def report(self):
+        self.received += 1
+        for listener in list(self.listeners):
+            try:
+                await listener(self.known_count + self.received)
+            except Exception as e:
+                logger.error(f"Error reporting generation progress: {e}", exc_info=True)
+
+inflight_generations = {}
+
+def get_generation_stats():
+    return {
+        "generations": generation_stats["generations"],
+        "coalesced": generation_stats["coalesced"],
+        "batches": subject_batcher.batches,
+        "batched_requests": subject_batcher.batched_requests,
+        "in_flight": len(inflight_generations)
+    }
+
+def add_progress_listener(flight, questions_count, on_progress):
+    async def listener(available):
+        await on_progress(min(available, questions_count), questions_count)
+
+    flight.listeners.append(listener)
+    return listener
+
+async def wait_for_generation(flight, questions_count, on_progress=None):
+    listener = add_progress_listener(flight, questions_count, on_progress) if on_progress else None
+    try:
+        return await asyncio.shield(flight.future)
+    finally:
+        if listener:
+            flight.listeners.remove(listener)
+
+async def run_generation(key, subject, description, questions_count, known_questions, on_progress=None,
+                         user_id=None, premium=False):
+    flight = GenerationFlight(len(known_questions))
+    inflight_generations[key] = flight
+    generation_stats["generations"] += 1
+    new_questions = []
+    try:
+        if on_progress:
+            add_progress_listener(flight, questions_count, on_progress)
+        try:
+            generated = await subject_batcher.request(
+                subject, description, questions_count - len(known_questions), on_question=lambda _: flight.report(),
+                user_id=user_id, premium=premium
+            )
+            new_questions = unique_questions(generated, {question_hash(q) for q in known_questions})
+        except Exception as e:
+            logger.error(f"Error generating questions: {e}", exc_info=True)
+        if new_questions:
+            await store_topic_questions(key, subject, description, known_questions, new_questions)
+    finally:
+        del inflight_generations[key]
+        if not flight.future.done():
+            flight.future.set_result(len(new_questions))
+    return new_questions
+
+async def request_batch_questions(subject, entries, on_question=None, user_id=None, premium=False):
+    topics = "\n".join(
+        f"{i}. {description or 'general questions on the subject'} ({count} questions)"
+        for i, (description, count) in enumerate(entries, 1)
+    )
+    prompt = (
+        f"Create multiple-choice test questions in Uzbek for the subject '{subject}' "
+        f"for each of the following topics:\n{topics}\n"
+        "Each question should have 4 options and one correct answer. "
+        "Return the result as a JSON list where each item has 'topic' (the topic number), "
+        "'question', 'options' (list), and 'answer' fields."
+    )
+    results = [[] for _ in entries]
+
+    async def route(question):
+        try:
+            index = int(str(question.pop("topic", "")).strip()) - 1
+        except ValueError:
+            index = -1
+        if not 0 <= index < len(entries):
+            logger.error("Skipping batched question without a valid topic number")
+            return
+        results[index].append(question)
+        if on_question:
+            await on_question(index, question)
+
+    await stream_questions(prompt, route, user_id, premium)
+    return results
+
+class SubjectBatcher:
+    def __init__(self, window, max_questions):
+        self.window = window
+        self.max_questions = max_questions
+        self.pending = {}
+        self.tasks = set()
+        self.batches = 0
+        self.batched_requests = 0
+
+    async def request(self, subject, description, questions_count, on_question=None, user_id=None, premium=False):
+        if self.window <= 0 or questions_count > self.max_questions:
+            return await request_questions_chunked(
+                subject, description, questions_count, on_question, user_id=user_id, premium=premium
+            )
+        key = normalize_text(subject)
+        batch = self.pending.get(key)
+        if batch and sum(entry["count"] for entry in batch) + questions_count > self.max_questions:
+            self.flush(key, subject)
+            batch = None
+        if batch is None:
+            batch = self.pending[key] = []
+            self.spawn(self.flush_later(key, subject, batch))
+        future = asyncio.get_running_loop().create_future()
+        batch.append({
+            "description": description,
+            "count": questions_count,
+            "on_question": on_question,
+            "user_id": user_id,
+            "premium": premium,
+            "future": future
+        })
+        if sum(entry["count"] for entry in batch) >= self.max_questions:
+            self.flush(key, subject)
+        return await future
+
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def flush_later(self, key, subject, batch):
+        await asyncio.sleep(self.window)
+        if self.pending.get(key) is batch:
+            self.flush(key, subject)
+
+    def flush(self, key, subject):
+        batch = self.pending.pop(key, None)
+        if batch:
+            self.spawn(self.run_batch(subject, batch))
+
+    async def run_batch(self, subject, batch):
+        try:
+            if len(batch) == 1:
+                entry = batch[0]
+                results = [await request_questions_chunked(
+                    subject, entry["description"], entry["count"], entry["on_question"],
+                    user_id=entry["user_id"], premium=entry["premium"]
+                )]
+            else:
+                self.batches += 1
+                self.batched_requests += len(batch)
+
+                async def report(index, question):
+                    on_question = batch[index]["on_question"]
+                    if on_question:
+                        await on_question(question)
+
+                lead = next((entry for entry in batch if entry["premium"]), batch[0])
+                results = await request_batch_questions(
+                    subject, [(entry["description"], entry["count"]) for entry in batch], report,
+                    user_id=lead["user_id"], premium=lead["premium"]
+                )
+                results = [unique_questions(questions)[:entry["count"]] for entry, questions in zip(batch, results)]
+                if not any(results):
+                    logger.error("Batched completion had no topic-tagged questions, requesting per topic")
+                results = await asyncio.gather(*(
+                    self.top_up(subject, entry, questions) for entry, questions in zip(batch, results)
+                ))
+        except Exception as e:
+            for entry in batch:
+                if not entry["future"].done():
+                    entry["future"].set_exception(e)
+            return
+        for entry, questions in zip(batch, results):
+            if not entry["future"].done():
+                entry["future"].set_result(questions[:entry["count"]])
+
+    async def top_up(self, subject, entry, questions):
+        missing = entry["count"] - len(questions)
+        if missing <= 0:
+            return questions
+        try:
+            extra = await request_questions_chunked(
+                subject, entry["description"], missing, entry["on_question"],
+                user_id=entry["user_id"], premium=entry["premium"]
+            )
+        except Exception as e:
+            logger.error(f"Error topping up batched questions: {e}")
+            return questions
+        return questions + unique_questions(extra, {question_hash(q) for q in questions})
+
+subject_batcher = SubjectBatcher(config.llm_batch_window, config.llm_batch_max_questions)
+
+async def generate_test_questions(subject, description, questions_count, on_progress=None, user_id=None, premium=False):
+    key = topic_key(subject, description)
+    new_questions = []
+    while True:
+        known_questions = await load_topic_questions(key)
+        if len(known_questions) >= questions_count:
+            return random.sample(known_questions, questions_count)
+        flight = inflight_generations.get(key)
+        if flight is None:
+            new_questions = await run_generation(
+                key, subject, description, questions_count, known_questions, on_progress,
+                user_id=user_id, premium=premium
+            )
+            break
+        generation_stats["coalesced"] += 1
+        if not await wait_for_generation(flight, questions_count, on_progress):
+            # Retrying right away would most likely fail again for every waiter.
+            break
+    questions = known_questions + new_questions
+    random.shuffle(questions)
+    if len(questions) < questions_count:
+        questions.extend(fallback_sample(subject, questions_count - len(questions)))
+    return questions[:questions_count]
 
-async def generate_test_document(subject, description, questions_count):
-    questions = await generate_test_questions(subject, description, questions_count)
+async def generate_test_document(subject, description, questions_count, on_progress=None, user_id=None, premium=False):
+    questions = await generate_test_questions(
+        subject, description, questions_count, on_progress, user_id=user_id, premium=premium
+    )
     doc = docx.Document()
     doc.add_heading(f"{subject} bo'yicha test", 0)
     if description:
@@ -0,0 +1,229 @@
+from aiogram.enums import ChatAction
+from aiogram.types import BufferedInputFile
+from bot.keyboards.inline import create_main_keyboard, create_contact_admin_keyboard
+from bot.utils.database import (
+    get_user_snapshot, record_test_completion, enqueue_generation_job, get_generation_queue_position,
+    claim_generation_job, finish_generation_job, fail_generation_job, requeue_generation_job,
+    requeue_stale_generation_jobs, count_queued_generation_jobs
+)
+from bot.utils.document import generate_test_document
+from bot.utils.logger import get_logger
+from bot.utils.user_cache import user_cache
+from config.config import load_config
+import asyncio
+import time
+
+logger = get_logger(__name__)
+config = load_config()
+PROGRESS_UPDATE_INTERVAL = 2
+STALE_JOB_GRACE = 60
+
+def earned_stars_for(questions_count):
+    return 2 if questions_count <= 10 else 5 if questions_count <= 20 else 10
+
+class GenerationWorkers:
+    def __init__(self, concurrency, poll_interval, max_attempts, job_timeout):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.job_timeout = job_timeout
+        self.bot = None
+        self.tasks = []
+        self.reaper = None
+        self.wakeup = None
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+        self.requeued = 0
+
+    async def start(self, bot):
+        if self.tasks:
+            return
+        self.bot = bot
+        self.wakeup = asyncio.Event()
+        requeued = await self.requeue_stale()
+        queued = await count_queued_generation_jobs()
+        self.tasks = [asyncio.create_task(self.run()) for _ in range(self.concurrency)]
+        self.reaper = asyncio.create_task(self.reap())
+        logger.info(f"Generation workers started (workers={self.concurrency}, queued={queued}, requeued={requeued})")
+
+    async def stop(self):
+        tasks = self.tasks + ([self.reaper] if self.reaper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tasks = []
+        self.reaper = None
+        logger.info("Generation workers stopped")
+
+    async def requeue_stale(self):
+        # A live worker never runs a job past job_timeout, so older ones were abandoned.
+        requeued = await requeue_stale_generation_jobs(self.job_timeout + STALE_JOB_GRACE)
+        if requeued:
+            self.requeued += requeued
+            self.notify()
+        return requeued
+
+    async def reap(self):
+        while True:
+            await asyncio.sleep(max(self.poll_interval, self.job_timeout / 10))
+            try:
+                await self.requeue_stale()
+            except Exception as e:
+                logger.error(f"Error requeueing stale generation jobs: {e}", exc_info=True)
+
+    def notify(self):
+        if self.wakeup:
+            self.wakeup.set()
+
+    async def enqueue(self, user_id, chat_id, progress_message_id, subject, description, questions_count, is_premium):
+        job_id = await enqueue_generation_job(
+            user_id, chat_id, progress_message_id, subject, description, questions_count, is_premium
+        )
+        if job_id is None:
+            return None
+        self.notify()
+        return max(await get_generation_queue_position(job_id), 1)
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                job = await claim_generation_job()
+            except Exception as e:
+                logger.error(f"Error claiming generation job: {e}", exc_info=True)
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                test_file = await asyncio.wait_for(self.process(job), self.job_timeout)
+                earned_stars = earned_stars_for(job["questions_count"])
+                completion = await record_test_completion(
+                    job["user_id"], job["subject"], job["description"], job["questions_count"], earned_stars
+                )
+                # Marked done before delivery: a retry after a failed send would
+                # generate and count the test a second time.
+                await finish_generation_job(job["id"])
+                self.completed += 1
+            except asyncio.CancelledError:
+                await requeue_generation_job(job["id"])
+                raise
+            except Exception as e:
+                await self.handle_failure(job, e)
+                continue
+            try:
+                await self.deliver(job, test_file, completion, earned_stars)
+            except Exception as e:
+                logger.error(f"Error delivering test to user {job['user_id']}: {e}", exc_info=True)
+
+    async def handle_failure(self, job, error):
+        logger.error(f"Generation job {job['id']} for user {job['user_id']} failed: {error!r}", exc_info=True)
+        try:
+            status = await fail_generation_job(job["id"], repr(error), self.max_attempts)
+        except Exception as e:
+            logger.error(f"Error recording failure of generation job {job['id']}: {e}", exc_info=True)
+            return
+        if status is None:
+            return
+        if status == "queued":
+            self.retried += 1
+            self.notify()
+            return
+        self.failed += 1
+        try:
+            await self.bot.send_message(
+                job["chat_id"],
+                "❌ Test yaratishda xatolik yuz berdi. Iltimos, keyinroq qayta urinib ko'ring yoki admin bilan bog'laning.",
+                reply_markup=create_contact_admin_keyboard()
+            )
+        except Exception as e:
+            logger.error(f"Error notifying user {job['user_id']} about failed job: {e}", exc_info=True)
+
+    async def process(self, job):
+        bot = self.bot
+        user_id = job["user_id"]
+        chat_id = job["chat_id"]
+        subject = job["subject"]
+        description = job["description"]
+        questions_count = job["questions_count"]
+        last_progress_update = 0.0
+
+        async def report_progress(done, total):
+            nonlocal last_progress_update
+            now = time.monotonic()
+            if not job["progress_message_id"] or now - last_progress_update < PROGRESS_UPDATE_INTERVAL:
+                return
+            last_progress_update = now
+            try:
+                await bot.edit_message_text(
+                    f"⏳ Test tayyorlanmoqda: {done}/{total} ta savol tayyor...",
+                    chat_id=chat_id,
+                    message_id=job["progress_message_id"]
+                )
+            except Exception as e:
+                logger.error(f"Error updating progress for user {user_id}: {e}")
+
+        await bot.send_chat_action(chat_id, ChatAction.TYPING)
+        test_file = await generate_test_document(
+            subject, description, questions_count, on_progress=report_progress,
+            user_id=user_id, premium=job["is_premium"]
+        )
+        if not test_file:
+            raise Exception("Failed to generate test document")
+        return test_file
+
+    async def deliver(self, job, test_file, completion, earned_stars):
+        bot = self.bot
+        chat_id = job["chat_id"]
+        subject = job["subject"]
+        await bot.send_chat_action(chat_id, ChatAction.UPLOAD_DOCUMENT)
+        await bot.send_document(
+            chat_id,
+            document=BufferedInputFile(test_file.getvalue(), filename=f"{subject}_test.docx"),
+            caption=(
+                f"✅ {subject} bo'yicha test\n"
+                f"📊 {job['questions_count']} ta savol\n"
+                f"❗️ Test yaratildi."
+            )
+        )
+        if earned_stars > 0:
+            current_stars = completion["stars"] or 0
+            await bot.send_message(
+                chat_id,
+                f"✨ Tabriklaymiz! {earned_stars} ta yulduz qo'shildi.\n"
+                f"💫 Jami yulduzlaringiz: {current_stars}\n\n"
+                f"ℹ️ Premium olish uchun {100 - current_stars} ta yulduz kerak bo'ladi."
+            )
+        user = await user_cache.get_or_load(job["user_id"], get_user_snapshot)
+        if user and user["is_premium"]:
+            premium_text = "Siz Premium foydalanuvchisiz! 💎"
+        else:
+            test_limit = (user["test_limit"] if user else None) or 30
+            premium_text = f"Qolgan bepul testlar: {max(0, test_limit - completion['test_count'])} ta"
+        await bot.send_message(
+            chat_id,
+            f"📋 Test yaratish muvaffaqiyatli yakunlandi!\n"
+            f"{premium_text}\n\n"
+            "Yana test yaratishni xohlaysizmi?",
+            reply_markup=create_main_keyboard()
+        )
+
+    def stats(self):
+        return {
+            "workers": len(self.tasks),
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "requeued": self.requeued
+        }
+
+generation_workers = GenerationWorkers(
+    concurrency=config.generation_workers,
+    poll_interval=config.generation_poll_interval,
+    max_attempts=config.generation_max_attempts,
+    job_timeout=config.generation_job_timeout
+)
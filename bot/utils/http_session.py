@@ -0,0 +1,57 @@
+import aiohttp
+from bot.utils.logger import get_logger
+from config.config import load_config
+
+logger = get_logger(__name__)
+config = load_config()
+
+class HttpSession:
+    def __init__(self, limit, limit_per_host, connect_timeout, read_timeout, keepalive_timeout):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+
+    async def start(self):
+        if self._session and not self._session.closed:
+            return self._session
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=300,
+            keepalive_timeout=self.keepalive_timeout,
+            enable_cleanup_closed=True
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(
+                total=None,
+                connect=self.connect_timeout,
+                sock_read=self.read_timeout
+            ),
+            headers={"Accept-Encoding": "gzip, deflate, br"},
+            auto_decompress=True
+        )
+        logger.info(f"HTTP session started (limit={self.limit}, per_host={self.limit_per_host})")
+        return self._session
+
+    async def get_session(self):
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+            logger.info("HTTP session closed")
+        self._session = None
+
+llm_http = HttpSession(
+    limit=config.llm_http_pool_size,
+    limit_per_host=config.llm_http_pool_size,
+    connect_timeout=config.llm_connect_timeout,
+    read_timeout=config.llm_read_timeout,
+    keepalive_timeout=config.llm_keepalive_timeout
+)
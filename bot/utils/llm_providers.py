@@ -0,0 +1,350 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from bot.utils import local_llm
+from bot.utils.http_session import llm_http
+from bot.utils.logger import get_logger
+from config.config import load_config
+import asyncio
+import json
+import multiprocessing
+import time
+
+logger = get_logger(__name__)
+config = load_config()
+LATENCY_WINDOW = 100
+OUTCOME_WINDOW = 50
+HEDGE_MIN_SAMPLES = 10
+
+class ProviderError(Exception):
+    def __init__(self, provider, message, status=None, retry_after=None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status = status
+        self.retry_after = retry_after
+
+async def iter_sse_content(response):
+    async for raw_line in response.content:
+        line = raw_line.decode("utf-8").strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            continue
+        choices = chunk.get("choices") or []
+        if choices:
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                yield content
+
+def parse_retry_after(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+class LLMProvider:
+    def __init__(self, name, url, model, api_key=None, max_tokens=4096, fallback=False):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.max_tokens = max_tokens
+        self.fallback = fallback
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.outcomes = deque(maxlen=OUTCOME_WINDOW)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    async def stream(self, prompt):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": self.max_tokens,
+            "temperature": 0.7,
+            "stream": config.llm_streaming
+        }
+        session = await llm_http.get_session()
+        async with session.post(self.url, json=payload, headers=headers) as response:
+            if response.status != 200:
+                raise ProviderError(
+                    self.name,
+                    f"API error: {response.status} - {await response.text()}",
+                    status=response.status,
+                    retry_after=parse_retry_after(response.headers.get("Retry-After"))
+                )
+            if config.llm_streaming:
+                async for content in iter_sse_content(response):
+                    yield content
+            else:
+                result = await response.json()
+                yield result["choices"][0]["message"]["content"]
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def is_busy(self):
+        return False
+
+    def is_available(self, now=None):
+        return (now or time.monotonic()) >= self.cooldown_until and not self.is_busy()
+
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def hedge_delay(self):
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.percentile(0.95), config.llm_hedge_min_delay)
+
+    def record_latency(self, latency):
+        self.latencies.append(latency)
+
+    def record_success(self):
+        self.requests += 1
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+
+    def record_failure(self, error, failure_threshold, cooldown):
+        self.requests += 1
+        self.errors += 1
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        if isinstance(error, ProviderError) and error.status == 429:
+            self.cooldown_until = time.monotonic() + (error.retry_after or cooldown)
+        elif self.consecutive_failures >= failure_threshold:
+            self.cooldown_until = time.monotonic() + cooldown
+
+    def stats(self):
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": self.error_rate(),
+            "p50_ms": p50 * 1000 if p50 is not None else None,
+            "p95_ms": p95 * 1000 if p95 is not None else None,
+            "available": self.is_available()
+        }
+
+class LocalLLMProvider(LLMProvider):
+    def __init__(self, name, model_path, workers, threads, context_size, max_tokens):
+        super().__init__(name, url=None, model=model_path, max_tokens=max_tokens, fallback=True)
+        self.workers = workers
+        self.threads = threads
+        self.context_size = context_size
+        self.executor = None
+        self.pending = set()
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=local_llm.init_worker,
+                initargs=(self.model, self.threads, self.context_size)
+            )
+        return self.executor
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor()
+        try:
+            await asyncio.gather(*(loop.run_in_executor(executor, local_llm.ping) for _ in range(self.workers)))
+            logger.info(f"Local LLM {self.name} loaded (workers={self.workers}, threads={self.threads})")
+        except Exception as e:
+            logger.error(f"Error loading local LLM {self.name}: {e}", exc_info=True)
+
+    def is_busy(self):
+        # A cancelled caller does not stop llama.cpp, so a worker stays taken
+        # until its own future finishes, not until the awaiting task goes away.
+        self.pending = {future for future in self.pending if not future.done()}
+        return len(self.pending) >= self.workers
+
+    async def stream(self, prompt):
+        try:
+            future = self.get_executor().submit(local_llm.generate, prompt, self.max_tokens)
+            self.pending.add(future)
+            content = await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            self.executor = None
+            raise ProviderError(self.name, "worker process died")
+        yield content
+
+    async def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+            self.pending.clear()
+
+    def stats(self):
+        result = super().stats()
+        self.is_busy()
+        result["in_flight"] = len(self.pending)
+        return result
+
+class LLMRouter:
+    def __init__(self, providers, hedging, failure_threshold, cooldown):
+        self.providers = providers
+        self.hedging = hedging
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def ranked(self):
+        now = time.monotonic()
+        available = [p for p in self.providers if p.is_available(now)]
+        if not available:
+            idle = [p for p in self.providers if not p.is_busy()]
+            return sorted(idle, key=lambda p: p.cooldown_until)
+        return sorted(available, key=lambda p: (p.fallback, p.error_rate(), p.percentile(0.5) or 0.0))
+
+    async def complete(self, prompt, on_text):
+        candidates = self.ranked()
+        last_error = None
+        while candidates:
+            primary = candidates.pop(0)
+            if primary.is_busy():
+                last_error = last_error or ProviderError(primary.name, "all workers busy")
+                continue
+            backup = next((p for p in candidates if not p.is_busy()), None) if self.hedging else None
+            if last_error is not None:
+                self.failovers += 1
+                logger.warning(f"Failing over to LLM provider {primary.name}: {last_error}")
+            try:
+                hedged = await self.race(prompt, on_text, primary, backup)
+                if hedged:
+                    candidates.remove(backup)
+                return
+            except Exception as e:
+                last_error = e
+                if getattr(e, "hedged", False):
+                    candidates.remove(backup)
+        raise last_error or ProviderError("router", "No LLM providers available")
+
+    async def race(self, prompt, on_text, primary, backup=None):
+        state = {"winner": None}
+        tasks = []
+
+        async def attempt(provider):
+            start = time.monotonic()
+            try:
+                async for text in provider.stream(prompt):
+                    if state["winner"] is None:
+                        state["winner"] = provider
+                        provider.record_latency(time.monotonic() - start)
+                        for task in tasks:
+                            if task is not asyncio.current_task():
+                                task.cancel()
+                    await on_text(text)
+                if state["winner"] is not provider:
+                    raise ProviderError(provider.name, "empty response")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                provider.record_failure(e, self.failure_threshold, self.cooldown)
+                raise
+            provider.record_success()
+
+        tasks.append(asyncio.create_task(attempt(primary)))
+        hedged = False
+        delay = primary.hedge_delay() if backup else None
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and state["winner"] is None and not backup.is_busy():
+                hedged = True
+                self.hedges += 1
+                tasks.append(asyncio.create_task(attempt(backup)))
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        winner = state["winner"]
+        if winner is not None:
+            if hedged and winner is backup:
+                self.hedge_wins += 1
+            error = results[0 if winner is primary else 1]
+            if isinstance(error, Exception):
+                # Content already reached the caller, so it is not retried elsewhere.
+                logger.error(f"LLM provider {winner.name} failed mid-response: {error}")
+            return hedged
+        errors = [result for result in results if isinstance(result, Exception)]
+        error = errors[0] if errors else ProviderError(primary.name, "no response")
+        error.hedged = hedged
+        raise error
+
+    async def start(self):
+        for provider in self.providers:
+            await provider.start()
+
+    async def close(self):
+        for provider in self.providers:
+            await provider.close()
+
+    def stats(self):
+        return {
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "providers": {provider.name: provider.stats() for provider in self.providers}
+        }
+
+def build_providers():
+    providers = []
+    if config.llm_providers:
+        providers = [
+            LLMProvider(
+                name=item["name"],
+                url=item["url"],
+                model=item["model"],
+                api_key=item.get("api_key"),
+                max_tokens=item.get("max_tokens", 4096),
+                fallback=item.get("fallback", False)
+            )
+            for item in config.llm_providers
+        ]
+    else:
+        providers = [
+            LLMProvider(
+                name="openrouter",
+                url="https://openrouter.ai/api/v1/chat/completions",
+                model="deepseek/deepseek-prover-v2:free",
+                api_key=config.openrouter_api_key
+            )
+        ]
+    if config.local_llm_model_path:
+        providers.append(
+            LocalLLMProvider(
+                name="local",
+                model_path=config.local_llm_model_path,
+                workers=config.local_llm_workers,
+                threads=config.local_llm_threads,
+                context_size=config.local_llm_context_size,
+                max_tokens=config.local_llm_max_tokens
+            )
+        )
+    return providers
+
+llm_router = LLMRouter(
+    build_providers(),
+    hedging=config.llm_hedging,
+    failure_threshold=config.llm_failure_threshold,
+    cooldown=config.llm_provider_cooldown
+)
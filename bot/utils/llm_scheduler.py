@@ -0,0 +1,125 @@
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from bot.utils.logger import get_logger
+from config.config import load_config
+import asyncio
+import time
+
+logger = get_logger(__name__)
+config = load_config()
+
+PREMIUM = "premium"
+FREE = "free"
+
+class LaneStats:
+    def __init__(self):
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_depth = 0
+
+    def record_wait(self, wait):
+        self.granted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+class LLMScheduler:
+    def __init__(self, concurrency, premium_burst):
+        self.concurrency = concurrency
+        self.premium_burst = premium_burst
+        self.active = 0
+        self.premium_streak = 0
+        self.lanes = {PREMIUM: OrderedDict(), FREE: OrderedDict()}
+        self.stats_by_lane = {PREMIUM: LaneStats(), FREE: LaneStats()}
+
+    def depth(self, lane):
+        return sum(len(waiters) for waiters in self.lanes[lane].values())
+
+    @asynccontextmanager
+    async def slot(self, user_id=None, premium=False):
+        await self.acquire(user_id, premium)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, user_id=None, premium=False):
+        lane = PREMIUM if premium else FREE
+        start = time.monotonic()
+        if self.active < self.concurrency and not self.depth(PREMIUM) and not self.depth(FREE):
+            self.active += 1
+            self.stats_by_lane[lane].record_wait(0.0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        waiters = self.lanes[lane].setdefault(user_id, deque())
+        waiters.append(future)
+        stats = self.stats_by_lane[lane]
+        stats.max_depth = max(stats.max_depth, self.depth(lane))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancellation.
+                self.release()
+            else:
+                self.discard(lane, user_id, future)
+            raise
+        stats.record_wait(time.monotonic() - start)
+
+    def discard(self, lane, user_id, future):
+        waiters = self.lanes[lane].get(user_id)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(future)
+        except ValueError:
+            pass
+        if not waiters:
+            del self.lanes[lane][user_id]
+
+    def next_waiter(self):
+        premium_waiting = bool(self.lanes[PREMIUM])
+        free_waiting = bool(self.lanes[FREE])
+        if premium_waiting and (not free_waiting or self.premium_streak < self.premium_burst):
+            self.premium_streak += 1
+            lane = PREMIUM
+        elif free_waiting:
+            self.premium_streak = 0
+            lane = FREE
+        else:
+            return None
+        users = self.lanes[lane]
+        user_id, waiters = next(iter(users.items()))
+        future = waiters.popleft()
+        if waiters:
+            users.move_to_end(user_id)
+        else:
+            del users[user_id]
+        return future
+
+    def release(self):
+        while True:
+            future = self.next_waiter()
+            if future is None:
+                self.active -= 1
+                return
+            if not future.done():
+                future.set_result(None)
+                return
+
+    def stats(self):
+        result = {
+            "concurrency": self.concurrency,
+            "active": self.active
+        }
+        for lane, stats in self.stats_by_lane.items():
+            result[lane] = {
+                "queued": self.depth(lane),
+                "max_queued": stats.max_depth,
+                "granted": stats.granted,
+                "avg_wait_ms": stats.total_wait / stats.granted * 1000 if stats.granted else 0.0,
+                "max_wait_ms": stats.max_wait * 1000
+            }
+        return result
+
+llm_scheduler = LLMScheduler(config.llm_max_concurrency, config.llm_premium_burst)
@@ -0,0 +1,17 @@
+_model = None
+
+def init_worker(model_path, n_threads, n_ctx):
+    global _model
+    from llama_cpp import Llama
+    _model = Llama(model_path=model_path, n_threads=n_threads, n_ctx=n_ctx, verbose=False)
+
+def ping():
+    return _model is not None
+
+def generate(prompt, max_tokens, temperature=0.7):
+    result = _model.create_chat_completion(
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=temperature
+    )
+    return result["choices"][0]["message"]["content"]
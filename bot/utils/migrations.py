@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import asyncpg
+import os
+import re
+from bot.utils.database import db
+from bot.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "migrations")
+MIGRATION_FILE_RE = re.compile(r"^(\d+)_([\w-]+)\.sql$")
+NO_TRANSACTION_MARKER = "-- no-transaction"
+MIGRATION_LOCK_ID = 7364921
+CONCURRENT_INDEX_RE = re.compile(
+    r"^CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?([\w.]+)",
+    re.IGNORECASE
+)
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE_RE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), encoding="utf-8") as f:
+            sql = f.read()
+        migrations.append({
+            "version": int(match.group(1)),
+            "name": match.group(2),
+            "sql": sql,
+            "transactional": not sql.lstrip().startswith(NO_TRANSACTION_MARKER)
+        })
+    versions = [m["version"] for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {directory}")
+    return sorted(migrations, key=lambda m: m["version"])
+
+def split_statements(sql):
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [stmt.strip() for stmt in "\n".join(lines).split(";") if stmt.strip()]
+
+async def get_applied_versions(conn):
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    rows = await conn.fetch('SELECT version FROM schema_version')
+    return {row["version"] for row in rows}
+
+async def index_is_valid(conn, name):
+    return await conn.fetchval(
+        'SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1)', name
+    )
+
+async def create_index_concurrently(conn, name, statement):
+    # A failed concurrent build leaves an INVALID index behind, which
+    # IF NOT EXISTS would then skip without rebuilding.
+    if await index_is_valid(conn, name) is False:
+        logger.warning(f"Dropping invalid index {name} left by an earlier attempt")
+        await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+    await conn.execute(statement)
+    if not await index_is_valid(conn, name):
+        raise RuntimeError(f"Index {name} was not built or is invalid")
+
+async def apply_migration(conn, migration):
+    logger.info(f"Applying migration {migration['version']:04d}_{migration['name']}")
+    if migration["transactional"]:
+        async with conn.transaction():
+            await conn.execute(migration["sql"])
+            await conn.execute(
+                'INSERT INTO schema_version (version, name) VALUES ($1, $2)',
+                migration["version"], migration["name"]
+            )
+    else:
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+        for statement in split_statements(migration["sql"]):
+            match = CONCURRENT_INDEX_RE.match(statement)
+            if match:
+                await create_index_concurrently(conn, match.group(1), statement)
+            else:
+                await conn.execute(statement)
+        await conn.execute(
+            'INSERT INTO schema_version (version, name) VALUES ($1, $2)',
+            migration["version"], migration["name"]
+        )
+
+async def run_migrations(target=None):
+    migrations = load_migrations()
+    applied = []
+    # Runs before the pool exists, since the pool prepares statements against the schema.
+    conn = await asyncpg.connect(**db.connect_kwargs())
+    try:
+        await conn.execute('SELECT pg_advisory_lock($1)', MIGRATION_LOCK_ID)
+        done = await get_applied_versions(conn)
+        for migration in migrations:
+            if migration["version"] in done:
+                continue
+            if target is not None and migration["version"] > target:
+                break
+            await apply_migration(conn, migration)
+            applied.append(migration["version"])
+    finally:
+        await conn.close()
+    if applied:
+        logger.info(f"Applied migrations: {applied}")
+    else:
+        logger.info("Database schema is up to date")
+    return applied
+
+async def get_migration_status():
+    migrations = load_migrations()
+    conn = await asyncpg.connect(**db.connect_kwargs())
+    try:
+        done = await get_applied_versions(conn)
+    finally:
+        await conn.close()
+    return [
+        {"version": m["version"], "name": m["name"], "applied": m["version"] in done}
+        for m in migrations
+    ]
+
+async def _main(args):
+    if args.command == "status":
+        for m in await get_migration_status():
+            mark = "x" if m["applied"] else " "
+            print(f"[{mark}] {m['version']:04d}_{m['name']}")
+    else:
+        await run_migrations(args.target)
+
+def main():
+    parser = argparse.ArgumentParser(description="Database schema migrations")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=["upgrade", "status"])
+    parser.add_argument("--target", type=int, default=None, help="Apply migrations up to this version")
+    asyncio.run(_main(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+from aiohttp import web
+
+COUNT_RE = re.compile(r"Create (\d+)")
+TOPIC_RE = re.compile(r"^(\d+)\. .*\((\d+) questions\)$", re.MULTILINE)
+
+def build_questions(prompt):
+    topics = TOPIC_RE.findall(prompt)
+    if topics:
+        slots = [int(topic) for topic, count in topics for _ in range(int(count))]
+    else:
+        match = COUNT_RE.search(prompt)
+        slots = [None] * (int(match.group(1)) if match else 5)
+    questions = []
+    for i, topic in enumerate(slots, 1):
+        question = {
+            "question": f"Mock savol {i} ({random.randint(0, 10 ** 9)})",
+            "options": ["A", "B", "C", "D"],
+            "answer": "A"
+        }
+        if topic is not None:
+            question["topic"] = topic
+        questions.append(question)
+    return questions
+
+def create_app(delay=0.0, error_rate=0.0, error_status=500, chunk_delay=0.0):
+    async def completions(request):
+        payload = await request.json()
+        await asyncio.sleep(delay)
+        if random.random() < error_rate:
+            return web.Response(status=error_status, text="mock failure", headers={"Retry-After": "1"})
+        prompt = payload["messages"][-1]["content"]
+        content = json.dumps(build_questions(prompt), ensure_ascii=False)
+        if not payload.get("stream"):
+            return web.json_response({"choices": [{"message": {"role": "assistant", "content": content}}]})
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for start in range(0, len(content), 64):
+            chunk = {"choices": [{"delta": {"content": content[start:start + 64]}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            if chunk_delay:
+                await asyncio.sleep(chunk_delay)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", completions)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible LLM provider")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds before the response starts")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+    web.run_app(
+        create_app(args.delay, args.error_rate, args.error_status, args.chunk_delay),
+        host=args.host,
+        port=args.port
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+QUERIES = {
+    "register_user": '''
+        INSERT INTO users (id, username, full_name)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (id) DO UPDATE
+        SET username = EXCLUDED.username, full_name = EXCLUDED.full_name
+    ''',
+    "get_user": 'SELECT * FROM users WHERE id = $1',
+    "record_test_completion": '''
+        WITH updated_user AS (
+            UPDATE users SET test_count = test_count + 1 WHERE id = $1
+            RETURNING test_count
+        ), inserted_test AS (
+            INSERT INTO tests (user_id, subject, description, questions_count)
+            VALUES ($1, $2, $3, $4)
+            RETURNING id
+        ), updated_stars AS (
+            INSERT INTO stars (user_id, stars)
+            VALUES ($1, $5)
+            ON CONFLICT (user_id) DO UPDATE
+            SET stars = stars.stars + $5
+            RETURNING stars
+        )
+        SELECT (SELECT id FROM inserted_test) AS test_id,
+               (SELECT test_count FROM updated_user) AS test_count,
+               (SELECT stars FROM updated_stars) AS stars
+    ''',
+    "get_user_tests": '''
+        SELECT * FROM tests WHERE user_id = $1
+        ORDER BY created_at DESC
+        LIMIT $2
+    ''',
+    "get_user_snapshot": '''
+        SELECT u.*,
+               COALESCE(s.stars, 0) AS stars,
+               u.test_count AS total_tests
+        FROM users u
+        LEFT JOIN stars s ON s.user_id = u.id
+        WHERE u.id = $1
+    ''',
+    "get_user_tests_first_page": '''
+        SELECT id, subject, questions_count, created_at FROM tests
+        WHERE user_id = $1
+        ORDER BY created_at DESC, id DESC
+        LIMIT $2
+    ''',
+    "get_user_tests_after": '''
+        SELECT id, subject, questions_count, created_at FROM tests
+        WHERE user_id = $1 AND (created_at, id) < ($2, $3)
+        ORDER BY created_at DESC, id DESC
+        LIMIT $4
+    ''',
+    "get_user_tests_before": '''
+        SELECT id, subject, questions_count, created_at FROM tests
+        WHERE user_id = $1 AND (created_at, id) > ($2, $3)
+        ORDER BY created_at ASC, id ASC
+        LIMIT $4
+    ''',
+    "get_user_stars": 'SELECT stars FROM stars WHERE user_id = $1',
+    "add_user_stars": '''
+        INSERT INTO stars (user_id, stars)
+        VALUES ($1, $2)
+        ON CONFLICT (user_id) DO UPDATE
+        SET stars = stars.stars + $2
+    ''',
+    "spend_stars_for_premium": '''
+        WITH spent AS (
+            UPDATE stars SET stars = stars - $2
+            WHERE user_id = $1 AND stars >= $2
+            RETURNING stars
+        ), premium AS (
+            UPDATE users SET is_premium = TRUE, test_limit = NULL
+            WHERE id = $1 AND EXISTS (SELECT 1 FROM spent)
+            RETURNING id
+        )
+        SELECT stars FROM spent
+    ''',
+    "set_premium_status": 'UPDATE users SET is_premium = $2, test_limit = NULL WHERE id = $1',
+    "record_payment": '''
+        INSERT INTO payments (user_id, amount, payment_type, currency, status, payment_id)
+        VALUES ($1, $2, $3, $4, $5, $6)
+    ''',
+    "update_payment_status": 'UPDATE payments SET status = $2 WHERE payment_id = $1',
+    "count_users": 'SELECT total_users FROM bot_stats',
+    "get_user_ids_batch": 'SELECT id FROM users WHERE id > $1 ORDER BY id LIMIT $2',
+    "get_bot_stats": 'SELECT total_users, premium_users, total_tests, total_stars FROM bot_stats',
+    "get_daily_stats": '''
+        SELECT
+            COALESCE(SUM(new_users) FILTER (WHERE day = CURRENT_DATE), 0) AS new_users_today,
+            COALESCE(SUM(tests_created) FILTER (WHERE day = CURRENT_DATE), 0) AS tests_today,
+            COALESCE(SUM(new_users), 0) AS new_users_period,
+            COALESCE(SUM(premium_activations), 0) AS premium_activations_period,
+            COALESCE(SUM(tests_created), 0) AS tests_period,
+            COALESCE(SUM(stars_earned), 0) AS stars_earned_period
+        FROM daily_stats
+        WHERE day > CURRENT_DATE - $1::int
+    ''',
+    "get_top_users": 'SELECT * FROM users ORDER BY test_count DESC LIMIT $1',
+    "update_user_limit": 'UPDATE users SET test_limit = $2 WHERE id = $1',
+    "save_promo_codes_bulk": '''
+        INSERT INTO promo_codes (code, duration_days)
+        SELECT code, $2 FROM unnest($1::text[]) AS code
+        ON CONFLICT (code) DO NOTHING
+        RETURNING code
+    ''',
+    "use_promo_code": '''
+        WITH redeemed AS (
+            UPDATE promo_codes
+            SET used_by = $2, used_at = CURRENT_TIMESTAMP
+            WHERE code = $1 AND used_by IS NULL
+            RETURNING duration_days
+        ), premium AS (
+            UPDATE users SET is_premium = TRUE, test_limit = NULL
+            WHERE id = $2 AND EXISTS (SELECT 1 FROM redeemed)
+            RETURNING id
+        )
+        SELECT duration_days FROM redeemed
+    ''',
+    "get_topic_questions": 'SELECT question FROM topic_questions WHERE topic_key = $1',
+    "save_topic_questions": '''
+        INSERT INTO topic_questions (topic_key, question_hash, subject, topic, question)
+        SELECT $1, h, $2, $3, q::jsonb
+        FROM unnest($4::text[], $5::text[]) AS t(h, q)
+        ON CONFLICT (topic_key, question_hash) DO NOTHING
+    ''',
+    "get_channel_memberships": '''
+        SELECT channel_id, status FROM channel_members
+        WHERE user_id = $1 AND channel_id = ANY($2::bigint[])
+          AND updated_at > CURRENT_TIMESTAMP - make_interval(secs => $3::double precision)
+    ''',
+    "save_channel_memberships": '''
+        INSERT INTO channel_members (channel_id, user_id, status, updated_at)
+        SELECT channel_id, $1, status, CURRENT_TIMESTAMP
+        FROM unnest($2::bigint[], $3::text[]) AS m(channel_id, status)
+        ON CONFLICT (user_id, channel_id) DO UPDATE
+        SET status = EXCLUDED.status, updated_at = EXCLUDED.updated_at
+    ''',
+    "set_admin_status": 'UPDATE users SET is_admin = $2 WHERE id = $1',
+    "check_is_admin": 'SELECT is_admin FROM users WHERE id = $1',
+    "enqueue_generation_job": '''
+        INSERT INTO generation_jobs (user_id, chat_id, progress_message_id, subject, description, questions_count, is_premium)
+        VALUES ($1, $2, $3, $4, $5, $6, $7)
+        ON CONFLICT (user_id) WHERE status IN ('queued', 'running') DO NOTHING
+        RETURNING id
+    ''',
+    "get_generation_queue_position": '''
+        SELECT count(*) FROM generation_jobs q, generation_jobs j
+        WHERE j.id = $1 AND q.status = 'queued'
+          AND (q.is_premium > j.is_premium
+               OR (q.is_premium = j.is_premium AND (q.created_at, q.id) <= (j.created_at, j.id)))
+    ''',
+    "claim_generation_job": '''
+        UPDATE generation_jobs
+        SET status = 'running', started_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+        WHERE id = (
+            SELECT id FROM generation_jobs
+            WHERE status = 'queued'
+            ORDER BY is_premium DESC, created_at, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+    ''',
+    "finish_generation_job": '''
+        UPDATE generation_jobs
+        SET status = 'done', error = NULL, finished_at = CURRENT_TIMESTAMP
+        WHERE id = $1
+    ''',
+    "fail_generation_job": '''
+        UPDATE generation_jobs
+        SET status = CASE WHEN attempts < $3 THEN 'queued' ELSE 'failed' END,
+            error = $2,
+            finished_at = CASE WHEN attempts < $3 THEN NULL ELSE CURRENT_TIMESTAMP END
+        WHERE id = $1 AND status = 'running'
+        RETURNING status
+    ''',
+    "requeue_generation_job": '''
+        UPDATE generation_jobs
+        SET status = 'queued', attempts = GREATEST(attempts - 1, 0), started_at = NULL
+        WHERE id = $1 AND status = 'running'
+    ''',
+    "requeue_stale_generation_jobs": '''
+        UPDATE generation_jobs
+        SET status = 'queued', started_at = NULL
+        WHERE status = 'running'
+          AND started_at < CURRENT_TIMESTAMP - make_interval(secs => $1::double precision)
+        RETURNING id
+    ''',
+    "count_queued_generation_jobs": "SELECT count(*) FROM generation_jobs WHERE status = 'queued'",
+}
@@ -1,23 +1,79 @@
 from aiogram import Bot
+from bot.utils.cache import create_cache
+from bot.utils.database import get_channel_memberships, save_channel_memberships
 from bot.utils.logger import get_logger
 from config.config import load_config
+import asyncio
 
 logger = get_logger(__name__)
 config = load_config()
+subscribed_cache = create_cache("subscribed", maxsize=config.user_cache_size, ttl=config.subscription_cache_ttl)
+unsubscribed_cache = create_cache("unsubscribed", maxsize=config.user_cache_size, ttl=config.subscription_negative_ttl)
 
-async def check_subscription(user_id, channels):
-    bot = Bot.get_current()
-    if not bot:
-        bot = Bot(token=config.bot_token)
-    try:
-        for channel in channels:
-            chat_member = await bot.get_chat_member(channel["id"], user_id)
-            if chat_member.status in ["left", "kicked"]:
-                return False
+NOT_MEMBER_STATUSES = ["left", "kicked"]
+
+def status_name(status):
+    return getattr(status, "value", status)
+
+def is_member_status(status):
+    return status_name(status) not in NOT_MEMBER_STATUSES
+
+async def _fetch_statuses(bot, user_id, channel_ids):
+    members = await asyncio.gather(*(
+        bot.get_chat_member(channel_id, user_id) for channel_id in channel_ids
+    ))
+    return {channel_id: status_name(member.status) for channel_id, member in zip(channel_ids, members)}
+
+async def _resolve_subscription(bot, user_id, channels, force_refresh):
+    channel_ids = [channel["id"] for channel in channels]
+    if force_refresh:
+        statuses = {}
+    else:
+        # Rows older than the max age may have missed chat_member updates
+        # (e.g. dropped during a deploy), so they are checked again.
+        statuses = await get_channel_memberships(user_id, channel_ids, config.channel_member_max_age)
+    missing = [channel_id for channel_id in channel_ids if channel_id not in statuses]
+    if missing:
+        own_bot = bot is None
+        if own_bot:
+            bot = Bot(token=config.bot_token)
+        try:
+            fetched = await _fetch_statuses(bot, user_id, missing)
+        finally:
+            if own_bot:
+                await bot.session.close()
+        await save_channel_memberships(user_id, fetched)
+        statuses.update(fetched)
+    return all(is_member_status(statuses[channel_id]) for channel_id in channel_ids)
+
+async def remember_subscription(user_id, is_subscribed):
+    if is_subscribed:
+        await subscribed_cache.set(user_id, True)
+        await unsubscribed_cache.delete(user_id)
+    else:
+        await unsubscribed_cache.set(user_id, True)
+        await subscribed_cache.delete(user_id)
+
+async def forget_subscription(user_id):
+    await subscribed_cache.delete(user_id)
+    await unsubscribed_cache.delete(user_id)
+
+async def record_membership_update(channel_id, user_id, status):
+    await save_channel_memberships(user_id, {channel_id: status})
+    await forget_subscription(user_id)
+
+async def check_subscription(user_id, channels, bot=None, force_refresh=False):
+    if not channels:
         return True
+    if not force_refresh:
+        if await subscribed_cache.get(user_id):
+            return True
+        if await unsubscribed_cache.get(user_id):
+            return False
+    try:
+        is_subscribed = await _resolve_subscription(bot, user_id, channels, force_refresh)
     except Exception as e:
         logger.error(f"Error checking subscription for user {user_id}: {e}", exc_info=True)
         return False
-    finally:
-        if not Bot.get_current():
-            await bot.session.close()
+    await remember_subscription(user_id, is_subscribed)
+    return is_subscribed
@@ -0,0 +1,64 @@
+from bot.utils.cache import create_cache
+from bot.utils.logger import get_logger
+from config.config import load_config
+
+logger = get_logger(__name__)
+config = load_config()
+
+class UserCache:
+    def __init__(self, maxsize, ttl):
+        self._entries = create_cache("users", maxsize, ttl)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def begin_load(self, user_id):
+        # Kept in the backend so invalidations from other processes count too.
+        return await self._entries.get_version(user_id)
+
+    async def get(self, user_id):
+        user = await self._entries.get(user_id)
+        if user is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return user
+
+    async def set(self, user_id, user, version=None):
+        if user is None:
+            return
+        if version is None:
+            await self._entries.set(user_id, dict(user))
+        else:
+            await self._entries.set_if_version(user_id, dict(user), version)
+
+    async def invalidate(self, user_id):
+        await self._entries.bump_version(user_id)
+        await self._entries.delete(user_id)
+        self.invalidations += 1
+
+    async def get_or_load(self, user_id, loader):
+        user = await self.get(user_id)
+        if user is None:
+            user = await self.refresh(user_id, loader)
+        return user
+
+    async def refresh(self, user_id, loader):
+        version = await self.begin_load(user_id)
+        user = await loader(user_id)
+        if version is not None:
+            await self.set(user_id, user, version)
+        return user
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": self._entries.backend.name,
+            "size": self._entries.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations
+        }
+
+user_cache = UserCache(maxsize=config.user_cache_size, ttl=config.user_cache_ttl)
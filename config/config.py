@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 def load_config():
@@ -13,6 +14,42 @@ def load_config():
         "db_name": os.getenv("DB_NAME", "testbor"),
         "db_user": os.getenv("DB_USER", "postgres"),
         "db_password": os.getenv("DB_PASSWORD", ""),
+        "db_pool_min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+        "db_pool_max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+        "user_cache_size": int(os.getenv("USER_CACHE_SIZE", 20000)),
+        "user_cache_ttl": int(os.getenv("USER_CACHE_TTL", 300)),
+        "cache_backend": os.getenv("CACHE_BACKEND", "memory"),
+        "cache_prefix": os.getenv("CACHE_PREFIX", "testbor"),
+        "redis_url": os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+        "redis_timeout": float(os.getenv("REDIS_TIMEOUT", 1.0)),
+        "subscription_cache_ttl": int(os.getenv("SUBSCRIPTION_CACHE_TTL", 300)),
+        "subscription_negative_ttl": int(os.getenv("SUBSCRIPTION_NEGATIVE_TTL", 20)),
+        "channel_member_max_age": int(os.getenv("CHANNEL_MEMBER_MAX_AGE", 86400)),
+        "llm_http_pool_size": int(os.getenv("LLM_HTTP_POOL_SIZE", 20)),
+        "llm_connect_timeout": float(os.getenv("LLM_CONNECT_TIMEOUT", 10)),
+        "llm_read_timeout": float(os.getenv("LLM_READ_TIMEOUT", 120)),
+        "llm_keepalive_timeout": float(os.getenv("LLM_KEEPALIVE_TIMEOUT", 60)),
+        "llm_streaming": os.getenv("LLM_STREAMING", "true").lower() == "true",
+        "llm_chunk_size": int(os.getenv("LLM_CHUNK_SIZE", 15)),
+        "llm_chunk_concurrency": int(os.getenv("LLM_CHUNK_CONCURRENCY", 4)),
+        "llm_batch_window": float(os.getenv("LLM_BATCH_WINDOW", 0.5)),
+        "llm_batch_max_questions": int(os.getenv("LLM_BATCH_MAX_QUESTIONS", 15)),
+        "llm_max_concurrency": int(os.getenv("LLM_MAX_CONCURRENCY", 8)),
+        "llm_premium_burst": int(os.getenv("LLM_PREMIUM_BURST", 3)),
+        "llm_providers": json.loads(os.getenv("LLM_PROVIDERS") or "[]"),
+        "llm_hedging": os.getenv("LLM_HEDGING", "false").lower() == "true",
+        "llm_hedge_min_delay": float(os.getenv("LLM_HEDGE_MIN_DELAY", 1.0)),
+        "llm_failure_threshold": int(os.getenv("LLM_FAILURE_THRESHOLD", 3)),
+        "llm_provider_cooldown": float(os.getenv("LLM_PROVIDER_COOLDOWN", 30)),
+        "local_llm_model_path": os.getenv("LOCAL_LLM_MODEL_PATH", ""),
+        "local_llm_workers": int(os.getenv("LOCAL_LLM_WORKERS", 1)),
+        "local_llm_threads": int(os.getenv("LOCAL_LLM_THREADS", 4)),
+        "local_llm_context_size": int(os.getenv("LOCAL_LLM_CONTEXT_SIZE", 4096)),
+        "local_llm_max_tokens": int(os.getenv("LOCAL_LLM_MAX_TOKENS", 2048)),
+        "generation_workers": int(os.getenv("GENERATION_WORKERS", 4)),
+        "generation_poll_interval": float(os.getenv("GENERATION_POLL_INTERVAL", 5)),
+        "generation_max_attempts": int(os.getenv("GENERATION_MAX_ATTEMPTS", 2)),
+        "generation_job_timeout": float(os.getenv("GENERATION_JOB_TIMEOUT", 600)),
         "admin_ids": [int(x) for x in os.getenv("ADMIN_IDS").split(",") if x],
         "required_channels": [
             {"name": channel_name, "id": int(channel_id), "url": channel_url}
@@ -6,7 +6,15 @@ from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_applicati
 from aiohttp import web
 from bot.handlers.register_handlers import register_handlers
 from bot.utils.logger import get_logger
-from bot.utils.database import init_db
+from bot.utils.database import db
+from bot.utils.migrations import run_migrations
+from bot.utils.user_cache import user_cache
+from bot.utils.cache import close_caches
+from bot.utils.http_session import llm_http
+from bot.utils.document import get_generation_stats
+from bot.utils.llm_scheduler import llm_scheduler
+from bot.utils.llm_providers import llm_router
+from bot.utils.generation_jobs import generation_workers
 from config.config import load_config
 import ssl
 import hmac
@@ -43,14 +51,11 @@ async def crypto_webhook_handler(request: web.Request):
         amount = float(invoice.get("amount", 0))
         currency = invoice.get("asset", "")
         bot = request.app["bot"]
-        from bot.utils.database import set_premium_status, update_payment_status, get_user
-        from cachetools import TTLCache
-        user_cache = TTLCache(maxsize=1000, ttl=300)
+        from bot.utils.database import set_premium_status, update_payment_status, get_user_snapshot
         await set_premium_status(user_id, True)
         payment_id = f"crypto_{user_id}_{custom_payload}"
         await update_payment_status(payment_id, "completed")
-        user = user_cache.get(user_id) or await get_user(user_id)
-        user_cache[user_id] = user
+        user = await user_cache.get_or_load(user_id, get_user_snapshot)
         username = user["username"] if user else "Noma'lum"
         full_name = user["full_name"] if user else "Noma'lum"
         payment_info = {
@@ -92,11 +97,16 @@ async def crypto_webhook_handler(request: web.Request):
 
 async def on_startup(dp: Dispatcher, bot: Bot):
     try:
-        await init_db()
+        await run_migrations()
+        await db.connect()
+        await llm_http.start()
+        await llm_router.start()
+        await generation_workers.start(bot)
         await bot.set_webhook(
             url=f"https://{config.webhook_domain}{config.webhook_path}",
             certificate=open(config.ssl_cert, 'rb') if config.ssl_cert else None,
-            drop_pending_updates=True
+            drop_pending_updates=True,
+            allowed_updates=dp.resolve_used_update_types()
         )
         logger.info("Webhook set successfully")
     except Exception as e:
@@ -108,6 +118,32 @@ async def on_shutdown(dp: Dispatcher, bot: Bot):
         logger.info("Webhook deleted successfully")
     except Exception as e:
         logger.error(f"Error on shutdown: {e}", exc_info=True)
+    try:
+        await generation_workers.stop()
+        logger.info(f"Generation worker stats: {generation_workers.stats()}")
+    except Exception as e:
+        logger.error(f"Error stopping generation workers: {e}", exc_info=True)
+    try:
+        logger.info(f"Database pool stats: {db.get_pool_stats()}")
+        logger.info(f"User cache stats: {user_cache.stats()}")
+        logger.info(f"Question generation stats: {get_generation_stats()}")
+        logger.info(f"LLM scheduler stats: {llm_scheduler.stats()}")
+        logger.info(f"LLM provider stats: {llm_router.stats()}")
+        await db.close()
+    except Exception as e:
+        logger.error(f"Error closing database pool: {e}", exc_info=True)
+    try:
+        await close_caches()
+    except Exception as e:
+        logger.error(f"Error closing cache backend: {e}", exc_info=True)
+    try:
+        await llm_router.close()
+    except Exception as e:
+        logger.error(f"Error closing LLM providers: {e}", exc_info=True)
+    try:
+        await llm_http.close()
+    except Exception as e:
+        logger.error(f"Error closing HTTP session: {e}", exc_info=True)
 
 def main():
     bot = Bot(token=config.bot_token, parse_mode="HTML")
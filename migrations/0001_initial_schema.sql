@@ -0,0 +1,46 @@
+CREATE TABLE IF NOT EXISTS users (
+    id BIGINT PRIMARY KEY,
+    username TEXT,
+    full_name TEXT,
+    is_premium BOOLEAN DEFAULT FALSE,
+    test_count INTEGER DEFAULT 0,
+    test_limit INTEGER DEFAULT 30,
+    registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_admin BOOLEAN DEFAULT FALSE
+);
+CREATE INDEX IF NOT EXISTS idx_users_id ON users(id);
+
+CREATE TABLE IF NOT EXISTS tests (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT REFERENCES users(id),
+    subject TEXT,
+    description TEXT,
+    questions_count INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_tests_user_id ON tests(user_id);
+
+CREATE TABLE IF NOT EXISTS stars (
+    user_id BIGINT PRIMARY KEY REFERENCES users(id),
+    stars INTEGER DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS payments (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT REFERENCES users(id),
+    amount FLOAT,
+    payment_type TEXT,
+    currency TEXT,
+    status TEXT,
+    payment_id TEXT UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_payments_user_id ON payments(user_id);
+
+CREATE TABLE IF NOT EXISTS promo_codes (
+    code TEXT PRIMARY KEY,
+    duration_days INTEGER,
+    used_by BIGINT REFERENCES users(id),
+    used_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,3 @@
+-- no-transaction
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_payments_status ON payments(status);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tests_user_id_created_at ON tests(user_id, created_at DESC, id DESC);
@@ -0,0 +1,123 @@
+CREATE TABLE IF NOT EXISTS bot_stats (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    total_users BIGINT NOT NULL DEFAULT 0,
+    premium_users BIGINT NOT NULL DEFAULT 0,
+    total_tests BIGINT NOT NULL DEFAULT 0,
+    total_stars BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS daily_stats (
+    day DATE PRIMARY KEY,
+    new_users INTEGER NOT NULL DEFAULT 0,
+    premium_activations INTEGER NOT NULL DEFAULT 0,
+    tests_created INTEGER NOT NULL DEFAULT 0,
+    stars_earned BIGINT NOT NULL DEFAULT 0
+);
+
+LOCK TABLE users, tests, stars IN SHARE ROW EXCLUSIVE MODE;
+
+INSERT INTO bot_stats (id, total_users, premium_users, total_tests, total_stars)
+SELECT TRUE,
+       (SELECT COUNT(*) FROM users),
+       (SELECT COUNT(*) FROM users WHERE is_premium = TRUE),
+       (SELECT COUNT(*) FROM tests),
+       (SELECT COALESCE(SUM(stars), 0) FROM stars)
+ON CONFLICT (id) DO UPDATE
+SET total_users = EXCLUDED.total_users,
+    premium_users = EXCLUDED.premium_users,
+    total_tests = EXCLUDED.total_tests,
+    total_stars = EXCLUDED.total_stars;
+
+INSERT INTO daily_stats (day, new_users)
+SELECT registration_date::date, COUNT(*) FROM users
+WHERE registration_date IS NOT NULL
+GROUP BY registration_date::date
+ON CONFLICT (day) DO UPDATE SET new_users = EXCLUDED.new_users;
+
+INSERT INTO daily_stats (day, tests_created)
+SELECT created_at::date, COUNT(*) FROM tests
+WHERE created_at IS NOT NULL
+GROUP BY created_at::date
+ON CONFLICT (day) DO UPDATE SET tests_created = EXCLUDED.tests_created;
+
+CREATE OR REPLACE FUNCTION bump_daily_stats(p_new_users INTEGER, p_premium INTEGER, p_tests INTEGER, p_stars BIGINT)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO daily_stats (day, new_users, premium_activations, tests_created, stars_earned)
+    VALUES (CURRENT_DATE, p_new_users, p_premium, p_tests, p_stars)
+    ON CONFLICT (day) DO UPDATE
+    SET new_users = daily_stats.new_users + EXCLUDED.new_users,
+        premium_activations = daily_stats.premium_activations + EXCLUDED.premium_activations,
+        tests_created = daily_stats.tests_created + EXCLUDED.tests_created,
+        stars_earned = daily_stats.stars_earned + EXCLUDED.stars_earned;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION users_stats_trigger() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE bot_stats
+        SET total_users = total_users + 1,
+            premium_users = premium_users + CASE WHEN NEW.is_premium THEN 1 ELSE 0 END;
+        PERFORM bump_daily_stats(1, CASE WHEN NEW.is_premium THEN 1 ELSE 0 END, 0, 0);
+    ELSIF TG_OP = 'UPDATE' THEN
+        IF NEW.is_premium IS DISTINCT FROM OLD.is_premium THEN
+            UPDATE bot_stats
+            SET premium_users = premium_users + CASE WHEN NEW.is_premium THEN 1 ELSE -1 END;
+            IF NEW.is_premium THEN
+                PERFORM bump_daily_stats(0, 1, 0, 0);
+            END IF;
+        END IF;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE bot_stats
+        SET total_users = total_users - 1,
+            premium_users = premium_users - CASE WHEN OLD.is_premium THEN 1 ELSE 0 END;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION tests_stats_trigger() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE bot_stats SET total_tests = total_tests + 1;
+        PERFORM bump_daily_stats(0, 0, 1, 0);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE bot_stats SET total_tests = total_tests - 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stars_stats_trigger() RETURNS TRIGGER AS $$
+DECLARE
+    delta BIGINT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        delta := COALESCE(NEW.stars, 0);
+    ELSIF TG_OP = 'UPDATE' THEN
+        delta := COALESCE(NEW.stars, 0) - COALESCE(OLD.stars, 0);
+    ELSE
+        delta := -COALESCE(OLD.stars, 0);
+    END IF;
+    IF delta <> 0 THEN
+        UPDATE bot_stats SET total_stars = total_stars + delta;
+        IF delta > 0 THEN
+            PERFORM bump_daily_stats(0, 0, 0, delta);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_stats ON users;
+CREATE TRIGGER users_stats AFTER INSERT OR UPDATE OF is_premium OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION users_stats_trigger();
+
+DROP TRIGGER IF EXISTS tests_stats ON tests;
+CREATE TRIGGER tests_stats AFTER INSERT OR DELETE ON tests
+    FOR EACH ROW EXECUTE FUNCTION tests_stats_trigger();
+
+DROP TRIGGER IF EXISTS stars_stats ON stars;
+CREATE TRIGGER stars_stats AFTER INSERT OR UPDATE OF stars OR DELETE ON stars
+    FOR EACH ROW EXECUTE FUNCTION stars_stats_trigger();
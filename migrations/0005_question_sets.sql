@@ -0,0 +1,8 @@
+CREATE TABLE IF NOT EXISTS question_sets (
+    key TEXT PRIMARY KEY,
+    subject TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    questions_count INTEGER NOT NULL,
+    questions JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
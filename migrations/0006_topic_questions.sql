@@ -0,0 +1,21 @@
+CREATE TABLE IF NOT EXISTS topic_questions (
+    topic_key TEXT NOT NULL,
+    question_hash TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    question JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (topic_key, question_hash)
+);
+
+INSERT INTO topic_questions (topic_key, question_hash, subject, topic, question)
+SELECT encode(sha256(convert_to(qs.subject || chr(31) || qs.topic, 'UTF8')), 'hex'),
+       md5(lower(btrim(regexp_replace(q.value->>'question', '\s+', ' ', 'g')))),
+       qs.subject,
+       qs.topic,
+       q.value
+FROM question_sets qs
+CROSS JOIN LATERAL jsonb_array_elements(qs.questions) AS q(value)
+ON CONFLICT (topic_key, question_hash) DO NOTHING;
+
+DROP TABLE IF EXISTS question_sets;
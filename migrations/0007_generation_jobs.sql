@@ -0,0 +1,24 @@
+CREATE TABLE IF NOT EXISTS generation_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users(id),
+    chat_id BIGINT NOT NULL,
+    progress_message_id BIGINT,
+    subject TEXT NOT NULL,
+    description TEXT,
+    questions_count INTEGER NOT NULL,
+    is_premium BOOLEAN NOT NULL DEFAULT FALSE,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_generation_jobs_queued
+    ON generation_jobs (is_premium DESC, created_at, id)
+    WHERE status = 'queued';
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_generation_jobs_active_user
+    ON generation_jobs (user_id)
+    WHERE status IN ('queued', 'running');